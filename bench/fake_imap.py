@@ -0,0 +1,242 @@
+import asyncio
+import base64
+import datetime
+import random
+import re
+import threading
+from collections import Counter
+from email.header import decode_header
+from email.utils import format_datetime
+
+# 本機的假 IMAP 伺服器：只實作 bot 用得到的指令（LOGIN / SELECT / STATUS / UID SEARCH / UID FETCH / NOOP / IDLE），
+# 每個指令可以加上固定延遲，模擬連到 Gmail 的來回時間，並記錄每種指令被呼叫幾次
+
+SUBJECT_WORDS = ["作業", "期中考", "物理", "公告", "實驗", "課程", "成績", "蝦皮", "訂單", "陽明交通大學",
+                 "Homework", "Exam", "Lab", "Notice", "Meeting", "Report"]
+SENDER_NAMES = ["王小明", "陳大文", "林老師", "系辦", "Alice", "Bob", "Carol"]
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+def mime_word(text, charset):
+    if text.isascii():
+        return text
+    return f"=?{charset}?b?{base64.b64encode(text.encode(charset)).decode()}?="
+
+def decode_words(value):
+    return "".join(part.decode(charset or "utf-8") if isinstance(part, bytes) else part
+                   for part, charset in decode_header(value))
+
+class Message:
+    def __init__(self, uid, sender, address, subject, date, body, charset):
+        self.uid = uid
+        self.sender = f"{sender} <{address}>"
+        self.subject = subject
+        self.date = date
+        headers = [
+            f"Subject: {mime_word(subject, charset)}",
+            f"From: {mime_word(sender, charset)} <{address}>",
+            f"Date: {format_datetime(date)}",
+            f"Message-ID: <{uid}.bench@example.com>",
+            "MIME-Version: 1.0",
+            f"Content-Type: text/plain; charset={charset}",
+            "Content-Transfer-Encoding: base64",
+        ]
+        self.headers = [(line.split(":", 1)[0].upper(), (line + "\r\n").encode("ascii")) for line in headers]
+        self.body = (base64.encodebytes(body.encode(charset)).replace(b"\n", b"\r\n"))
+
+    def header_bytes(self, fields=None):
+        return b"".join(raw for name, raw in self.headers if fields is None or name in fields) + b"\r\n"
+
+def make_mailbox(size, course_senders=(), charsets=("utf-8", "big5"), course_ratio=0.1, seed=0):
+    """產生 size 封信：主旨和寄件人用 charsets 輪流編成 MIME encoded-word，約 course_ratio 比例是課程信件"""
+    rng = random.Random(seed)
+    start = datetime.datetime(2024, 1, 1, 8, 0, tzinfo=datetime.timezone(datetime.timedelta(hours=8)))
+    messages = []
+    course_senders = list(course_senders)
+    for uid in range(1, size + 1):
+        charset = charsets[uid % len(charsets)]
+        if course_senders and rng.random() < course_ratio:
+            sender = rng.choice(course_senders)
+        else:
+            sender = rng.choice(SENDER_NAMES)
+        subject = " ".join(rng.sample(SUBJECT_WORDS, 3)) + f" #{uid}"
+        body = f"{subject}\n" + " ".join(rng.choice(SUBJECT_WORDS) for _ in range(40))
+        date = start + datetime.timedelta(hours=uid * 3)
+        messages.append(Message(uid, sender, f"user{uid % 50}@example.com", subject, date, body, charset))
+    return messages
+
+def parse_uid_set(text, max_uid):
+    uids = set()
+    for part in text.split(","):
+        lo, _, hi = part.partition(":")
+        lo = max_uid if lo == "*" else int(lo)
+        hi = lo if not hi else (max_uid if hi == "*" else int(hi))
+        lo, hi = min(lo, hi), max(lo, hi)
+        uids.update(range(lo, hi + 1))
+    return uids
+
+def parse_date(text):
+    day, month, year = text.split("-")
+    return datetime.date(int(year), MONTHS.index(month) + 1, int(day))
+
+class FakeImapServer:
+    def __init__(self, messages, latency=0.0, host="127.0.0.1", port=0, uidvalidity=1):
+        self.messages = {message.uid: message for message in messages}
+        self.latency = latency
+        self.host = host
+        self.port = port
+        self.uidvalidity = uidvalidity
+        self.commands = Counter()  # 指令 -> 次數
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    # ---- 在獨立執行緒的 event loop 中執行，gmail_api 是阻塞式的 ----
+    def start(self):
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._server = self._loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+            self.port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="fake-imap", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        def close():
+            self._server.close()
+            self._loop.stop()
+        self._loop.call_soon_threadsafe(close)
+        self._thread.join()
+
+    def add_message(self, message):
+        self.messages[message.uid] = message
+
+    def round_trips(self):
+        return sum(self.commands.values())
+
+    # ---- 協定處理 ----
+    async def _read_command(self, reader, writer):
+        """讀一整個指令，處理 {n} literal（先回 + 再讀 n 個位元組），回傳 token 列表"""
+        tokens = []
+        while True:
+            line = await reader.readline()
+            if not line:
+                return None
+            line = line.rstrip(b"\r\n")
+            match = re.search(rb"\{(\d+)\}$", line)
+            tokens += self._tokenize(line[:match.start()] if match else line)
+            if not match:
+                return tokens
+            writer.write(b"+ Ready for literal\r\n")
+            await writer.drain()
+            tokens.append((await reader.readexactly(int(match.group(1)))).decode("utf-8"))
+
+    @staticmethod
+    def _tokenize(line):
+        return [quoted.replace('\\"', '"').replace("\\\\", "\\") if quoted or not atom else atom
+                for quoted, atom in re.findall(r'"((?:[^"\\]|\\.)*)"|(\S+)', line.decode("utf-8"))]
+
+    async def _handle(self, reader, writer):
+        writer.write(b"* OK Fake IMAP ready\r\n")
+        await writer.drain()
+        try:
+            while True:
+                tokens = await self._read_command(reader, writer)
+                if not tokens:
+                    break
+                tag, command, args = tokens[0], tokens[1].upper(), tokens[2:]
+                if command == "UID":
+                    command, args = "UID " + args[0].upper(), args[1:]
+                self.commands[command] += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                if command == "IDLE":
+                    writer.write(b"+ idling\r\n")
+                    await writer.drain()
+                    await reader.readline()  # DONE
+                    writer.write(f"{tag} OK IDLE terminated\r\n".encode())
+                else:
+                    writer.write(self._respond(tag, command, args))
+                await writer.drain()
+                if command == "LOGOUT":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _respond(self, tag, command, args):
+        ok = f"{tag} OK {command} completed\r\n".encode()
+        uidnext = max(self.messages, default=0) + 1
+        if command == "CAPABILITY":
+            return b"* CAPABILITY IMAP4rev1 IDLE UIDPLUS\r\n" + ok
+        if command in ("LOGIN", "NOOP", "CHECK"):
+            return ok
+        if command == "LOGOUT":
+            return b"* BYE logging out\r\n" + ok
+        if command in ("SELECT", "EXAMINE"):
+            return (f"* {len(self.messages)} EXISTS\r\n* 0 RECENT\r\n"
+                    f"* OK [UIDVALIDITY {self.uidvalidity}] UIDs valid\r\n* OK [UIDNEXT {uidnext}] next\r\n"
+                    f"{tag} OK [READ-WRITE] SELECT completed\r\n").encode()
+        if command == "STATUS":
+            return f"* STATUS {args[0]} (UIDNEXT {uidnext} UIDVALIDITY {self.uidvalidity})\r\n".encode() + ok
+        if command == "UID SEARCH":
+            uids = sorted(self._search(args))
+            return ("* SEARCH" + "".join(f" {uid}" for uid in uids) + "\r\n").encode() + ok
+        if command == "UID FETCH":
+            return self._fetch(args) + ok
+        return f"{tag} BAD unknown command {command}\r\n".encode()
+
+    def _search(self, args):
+        args = list(args)
+        if args and args[0].upper() == "CHARSET":
+            args = args[2:]
+        result = set(self.messages)
+        while args:
+            result &= self._criterion(args)
+        return result
+
+    def _criterion(self, args):
+        key = args.pop(0).upper()
+        if key == "ALL":
+            return set(self.messages)
+        if key == "OR":
+            return self._criterion(args) | self._criterion(args)
+        if key == "UID":
+            return parse_uid_set(args.pop(0), max(self.messages, default=0)) & set(self.messages)
+        if key in ("FROM", "SUBJECT"):
+            value = args.pop(0).lower()
+            attr = "sender" if key == "FROM" else "subject"
+            return {uid for uid, message in self.messages.items() if value in getattr(message, attr).lower()}
+        if key in ("SINCE", "BEFORE"):
+            day = parse_date(args.pop(0))
+            if key == "SINCE":
+                return {uid for uid, message in self.messages.items() if message.date.date() >= day}
+            return {uid for uid, message in self.messages.items() if message.date.date() < day}
+        raise ValueError(f"不支援的搜尋條件：{key}")
+
+    def _fetch(self, args):
+        wanted = " ".join(args[1:]).upper()
+        uids = sorted(parse_uid_set(args[0], max(self.messages, default=0)) & set(self.messages))
+        fields = None
+        match = re.search(r"HEADER\.FIELDS \(([^)]*)\)", wanted)
+        if match:
+            fields = set(match.group(1).split())
+        preview = re.search(r"BODY\.PEEK\[TEXT\]<0\.(\d+)>", wanted)
+        seq = {uid: index for index, uid in enumerate(sorted(self.messages), 1)}
+        out = []
+        for uid in uids:
+            message = self.messages[uid]
+            header = message.header_bytes(fields)
+            parts = [f"* {seq[uid]} FETCH (UID {uid} BODY[HEADER.FIELDS ({' '.join(sorted(fields or []))})] {{{len(header)}}}\r\n".encode(), header]
+            if preview:
+                body = message.body[:int(preview.group(1))]
+                parts += [f" BODY[TEXT]<0> {{{len(body)}}}\r\n".encode(), body]
+            parts.append(b")\r\n")
+            out += parts
+        return b"".join(out)
@@ -0,0 +1,136 @@
+import asyncio
+import datetime
+import itertools
+import random
+from collections import Counter
+from aiohttp import web
+
+# 本機的假 Notion API：資料庫查詢（分頁、title equals / OR、last_edited_time 篩選）、新增、修改、封存頁面。
+# 可以設定每個請求的延遲，以及隨機回 429（附 Retry-After）的比例
+
+def make_page(page_id, name, category, content="", hour=None, minute=None, created=None):
+    created = created or datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    properties = {
+        "Name": {"title": [{"text": {"content": name}}] if name else []},
+        "category": {"select": {"name": category} if category else None},
+        "content": {"rich_text": [{"text": {"content": content}}] if content else []},
+        "hour": {"number": hour},
+        "minute": {"number": minute},
+    }
+    stamp = created.isoformat().replace("+00:00", ".000Z")
+    return {"object": "page", "id": page_id, "created_time": stamp, "last_edited_time": stamp,
+            "archived": False, "properties": properties}
+
+def make_database(size, seed=0):
+    """size 個頁面：大部分是靈感，其餘是鬧鐘，另外加上兩個郵件鬧鐘"""
+    rng = random.Random(seed)
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    pages = [make_page("mail-timer-1", "mail_timer1", "timer", hour=8, minute=0, created=start),
+             make_page("mail-timer-2", "mail_timer2", "timer", hour=20, minute=0, created=start)]
+    for i in range(size):
+        created = start + datetime.timedelta(minutes=i)
+        if i % 5 == 0:
+            pages.append(make_page(f"timer-{i}", f"timer{i}", "timer", hour=rng.randrange(24), minute=rng.randrange(60), created=created))
+        else:
+            pages.append(make_page(f"idea-{i}", f"idea {i}", "idea", content=f"靈感內容 {i} " * 5, created=created))
+    return pages
+
+def _plain(value):
+    return value[0]["text"]["content"] if value else ""
+
+def _matches(page, query_filter):
+    if not query_filter:
+        return True
+    if "or" in query_filter:
+        return any(_matches(page, item) for item in query_filter["or"])
+    if "and" in query_filter:
+        return all(_matches(page, item) for item in query_filter["and"])
+    if query_filter.get("timestamp") == "last_edited_time":
+        return page["last_edited_time"] >= query_filter["last_edited_time"]["on_or_after"]
+    prop = page["properties"].get(query_filter.get("property"), {})
+    if "title" in query_filter:
+        return _plain(prop.get("title")) == query_filter["title"]["equals"]
+    if "select" in query_filter:
+        return (prop.get("select") or {}).get("name") == query_filter["select"]["equals"]
+    return True
+
+class FakeNotionServer:
+    def __init__(self, pages, latency=0.0, throttle_rate=0.0, retry_after=0.2, host="127.0.0.1", port=0, seed=0):
+        self.pages = {page["id"]: page for page in pages}
+        self.latency = latency
+        self.throttle_rate = throttle_rate  # 回 429 的比例
+        self.retry_after = retry_after
+        self.host = host
+        self.port = port
+        self.requests = Counter()  # "方法 路徑種類" -> 次數
+        self.throttled = 0
+        self._rng = random.Random(seed)
+        self._ids = itertools.count(len(self.pages))
+        self._runner = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    def round_trips(self):
+        return sum(self.requests.values())
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/v1/databases/{database_id}/query", self._query)
+        app.router.add_post("/v1/pages", self._create)
+        app.router.add_patch("/v1/pages/{page_id}", self._update)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self.port = self._runner.addresses[0][1]
+        return self
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    async def _gate(self, kind):
+        """共用的延遲和 429 注入；回傳 None 代表繼續處理"""
+        self.requests[kind] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.throttle_rate and self._rng.random() < self.throttle_rate:
+            self.throttled += 1
+            return web.json_response({"object": "error", "status": 429, "code": "rate_limited"}, status=429,
+                                     headers={"Retry-After": str(self.retry_after)})
+        return None
+
+    async def _query(self, request):
+        if (response := await self._gate("query")) is not None:
+            return response
+        body = await request.json()
+        page_size = min(body.get("page_size", 100), 100)
+        start = int(body.get("start_cursor") or 0)
+        matched = [page for page in self.pages.values() if not page["archived"] and _matches(page, body.get("filter"))]
+        results = matched[start:start + page_size]
+        has_more = start + page_size < len(matched)
+        return web.json_response({"object": "list", "results": results, "has_more": has_more,
+                                  "next_cursor": str(start + page_size) if has_more else None})
+
+    async def _create(self, request):
+        if (response := await self._gate("create")) is not None:
+            return response
+        body = await request.json()
+        now = datetime.datetime.now(datetime.timezone.utc)
+        page = make_page(f"new-{next(self._ids)}", "", None, created=now)
+        page["properties"].update(body.get("properties", {}))
+        self.pages[page["id"]] = page
+        return web.json_response(page)
+
+    async def _update(self, request):
+        if (response := await self._gate("update")) is not None:
+            return response
+        page = self.pages.get(request.match_info["page_id"])
+        if page is None:
+            return web.json_response({"object": "error", "status": 404}, status=404)
+        body = await request.json()
+        page["properties"].update(body.get("properties", {}))
+        if body.get("archived"):
+            page["archived"] = True
+        page["last_edited_time"] = datetime.datetime.now(datetime.timezone.utc).isoformat().replace("+00:00", ".000Z")
+        return web.json_response(page)
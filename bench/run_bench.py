@@ -0,0 +1,194 @@
+"""離線 benchmark：用本機的假 IMAP 伺服器和假 Notion API，量測信件查詢和 Notion 操作在不同信箱 / 資料庫大小下的
+p50 / p99 延遲、每秒次數和每次操作的來回次數。不需要 Gmail 帳號或 Notion workspace。
+
+    python bench/run_bench.py --mail-sizes 500 2000 --db-sizes 100 1000 --output bench_output.txt
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import unicodedata
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 要在 import gmail_api / notion_api 之前設定，讓它們連到本機的假伺服器
+_tmpdir = tempfile.mkdtemp(prefix="littleybj-bench-")
+os.environ["IMAP_HOST"] = "127.0.0.1"
+os.environ["IMAP_SSL"] = "0"
+os.environ["MY_GMAIL"] = "bench@example.com"
+os.environ["MY_GMAIL_PASSWORD"] = "bench"
+os.environ["MAIL_CACHE_PATH"] = os.path.join(_tmpdir, "mail_cache.db")
+os.environ.setdefault("NOTION_API_KEY", "bench")
+os.environ.setdefault("NOTION_DATABASE_ID", "bench-db")
+
+import gmail_api
+import littleybj
+import mail_backfill
+import mail_cache
+import notion_api
+from idea_index import IdeaIndex
+from notion_mirror import NotionMirror, page_title
+from bench.fake_imap import FakeImapServer, make_mailbox
+from bench.fake_notion import FakeNotionServer, make_database
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, round(p / 100 * (len(ordered) - 1)))]
+
+def pad(text, width, right=False):
+    """中文字在終端機佔兩格，照顯示寬度補空白"""
+    shown = sum(2 if unicodedata.east_asian_width(ch) in "WF" else 1 for ch in str(text))
+    space = " " * max(0, width - shown)
+    return space + str(text) if right else str(text) + space
+
+class Row:
+    def __init__(self, group, name, size, samples, round_trips, note=""):
+        self.group = group
+        self.name = name
+        self.size = size
+        self.samples = samples
+        self.round_trips = round_trips  # 平均每次操作的來回次數
+        self.note = note
+
+    def format(self):
+        p50 = percentile(self.samples, 50) * 1000
+        p99 = percentile(self.samples, 99) * 1000
+        throughput = len(self.samples) / sum(self.samples) if sum(self.samples) else float("inf")
+        return (pad(self.group, 8) + pad(self.name, 36) + f"{self.size:>7}{len(self.samples):>6}"
+                f"{p50:>11.2f}{p99:>11.2f}{throughput:>10.1f}{self.round_trips:>9.1f}  {self.note}").rstrip()
+
+HEADER = (pad("類別", 8) + pad("操作", 36) + pad("大小", 7, True) + pad("次數", 6, True) + pad("p50 ms", 11, True)
+          + pad("p99 ms", 11, True) + pad("次/秒", 10, True) + pad("來回/次", 9, True))
+
+# ---------------- Gmail ----------------
+
+def measure_sync(server, func, iterations):
+    samples = []
+    before = server.round_trips()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples, (server.round_trips() - before) / iterations
+
+def bench_mail(size, args):
+    server = FakeImapServer(make_mailbox(size, course_senders=gmail_api.TA_COURSE_TABLE.keys()),
+                            latency=args.imap_latency).start()
+    gmail_api.IMAP_PORT = server.port
+    gmail_api.pool.close_all()
+    gmail_api._cache = mail_cache.MailCache(os.path.join(_tmpdir, f"mail_{size}.db"))
+    rows = []
+
+    def run(name, func, iterations=args.iterations, note=""):
+        samples, trips = measure_sync(server, func, iterations)
+        rows.append(Row("gmail", name, size, samples, trips, note))
+
+    # 第一次同步（建立基準、連線）不列入計算
+    run("sync_new_emails（第一次）", lambda: gmail_api.sync_new_emails("bench"), 1)
+    run("search_emails 英文（IMAP）", lambda: gmail_api.search_emails("Homework", 30))
+    run("search_emails 中文（IMAP）", lambda: gmail_api.search_emails("物理", 30))
+    run("search_course_emails（IMAP）", lambda: gmail_api.search_course_emails(40))
+
+    before = server.round_trips()
+    result = mail_backfill.backfill_mailbox(workers=args.backfill_workers)
+    rows.append(Row("gmail", f"backfill_mailbox（{args.backfill_workers} 條連線）", size, [result["seconds"]],
+                    server.round_trips() - before, f"{result['messages'] / result['seconds']:.0f} 封/秒"))
+
+    run("search_emails 英文（索引）", lambda: gmail_api.search_emails("Homework", 30))
+    run("search_emails 中文（索引）", lambda: gmail_api.search_emails("物理", 30))
+    run("search_emails 長關鍵字（索引）", lambda: gmail_api.search_emails("陽明交通大學", 30))
+    run("search_course_emails（索引）", lambda: gmail_api.search_course_emails(40))
+    run("sync_new_emails（沒有新信）", lambda: gmail_api.sync_new_emails("bench"))
+
+    gmail_api.pool.close_all()
+    server.stop()
+    return rows
+
+# ---------------- Notion ----------------
+
+async def measure_async(server, func, iterations):
+    samples = []
+    before = server.round_trips()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await func()
+        samples.append(time.perf_counter() - start)
+    return samples, (server.round_trips() - before) / iterations
+
+async def bench_notion(size, args):
+    server = await FakeNotionServer(make_database(size), latency=args.notion_latency,
+                                    throttle_rate=args.throttle).start()
+    notion_api.NOTION_API_URL = server.url
+    client = notion_api.NotionClient(api_key="bench", database_id="bench-db")
+    client.limiter = notion_api.RateLimiter(rate=args.notion_rate, burst=args.notion_rate)
+    mirror = NotionMirror(client)
+    index = IdeaIndex(os.path.join(_tmpdir, f"ideas_{size}.json"))
+    # bot 的函式改用這次的鏡像和索引，量到的就是 bot 實際走的路徑
+    littleybj.notion_db = mirror
+    littleybj.idea_index = index
+    rows = []
+
+    async def run(name, func, iterations=args.iterations, note=""):
+        samples, trips = await measure_async(server, func, iterations)
+        rows.append(Row("notion", name, size, samples, trips, note))
+
+    await run("NotionMirror.load（分頁載入）", mirror.load, max(1, args.iterations // 5))
+    ideas = await mirror.category("idea")
+    index.rebuild(ideas)
+    names = [page_title(page) for page in ideas[::max(1, len(ideas) // 20)]][:20]  # 都是鏡像裡有的頁面
+    await run("依名稱查詢（鏡像查表，20 個）", lambda: asyncio.gather(*(mirror.get(name) for name in names)))
+    await run("鬧鐘列表（鏡像查表）", lambda: mirror.category("timer"))
+    await run("set_timers（鬧鐘對帳）", littleybj.set_timers)
+
+    counter = iter(range(10 ** 9))
+
+    async def add_idea():  # 和 ask_add_idea 按下 ✅ 之後一樣：先查重再新增
+        content = f"bench 靈感 {next(counter)}"
+        if not littleybj.idea_index.find_duplicate(content):
+            await littleybj.add_idea_to_db(content)
+
+    await run("add_idea_to_db（查重 + 建立）", add_idea)
+    timers = list(littleybj.timers_of(littleybj.YBJ_ID))
+    batches = iter([timers[i:i + 10] for i in range(0, len(timers), 10)])
+    await run("delete_db_timer（10 個）", lambda: littleybj.delete_db_timer(littleybj.YBJ_ID, next(batches)),
+              max(1, min(args.iterations, len(timers) // 10)))
+
+    rows[-1].note = f"429 注入 {server.throttled} 次"
+    await client.close()
+    await server.stop()
+    return rows
+
+# ---------------- main ----------------
+
+def main():
+    parser = argparse.ArgumentParser(description="LittleYBJ 離線 benchmark")
+    parser.add_argument("--mail-sizes", type=int, nargs="*", default=[500, 2000, 5000])
+    parser.add_argument("--db-sizes", type=int, nargs="*", default=[100, 500, 2000])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--backfill-workers", type=int, default=mail_backfill.BACKFILL_WORKERS, help="收錄整個信箱時的連線數")
+    parser.add_argument("--imap-latency", type=float, default=0.02, help="假 IMAP 每個指令的延遲（秒）")
+    parser.add_argument("--notion-latency", type=float, default=0.05, help="假 Notion 每個請求的延遲（秒）")
+    parser.add_argument("--throttle", type=float, default=0.05, help="假 Notion 回 429 的比例")
+    parser.add_argument("--notion-rate", type=float, default=3, help="Notion 速率限制（每秒請求數）")
+    parser.add_argument("--output", help="另外把結果寫到這個檔案")
+    args = parser.parse_args()
+
+    rows = []
+    for size in args.mail_sizes:
+        print(f"📬 信箱 {size} 封…")
+        rows += bench_mail(size, args)
+    for size in args.db_sizes:
+        print(f"🗂️ 資料庫 {size} 頁…")
+        rows += asyncio.run(bench_notion(size, args))
+
+    lines = [HEADER] + [row.format() for row in rows]
+    print("\n".join(lines))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import re
+from dataclasses import dataclass
+import discord
+from discord import app_commands
+
+@dataclass
+class Route:
+    triggers: tuple
+    handler: object  # async handler(invocation)
+    priority: int = 0  # 數字大的先比對
+    boundary: bool = True  # 觸發詞後面必須是空白或結尾（「信 關鍵字」可以，「信件好多」不行）
+    channels: frozenset = None  # 只在這些頻道生效，None 代表全部
+    slash: str = None  # 對應的 slash command 名稱
+    description: str = ""
+
+@dataclass
+class Invocation:
+    """一次指令呼叫：不管是打字還是 slash command，handler 拿到的都一樣"""
+    author_id: int
+    channel: object  # 下指令的頻道
+    args: list
+    reply: object  # async reply(text)，回覆給下指令的人
+
+class CommandRouter:
+    """把所有觸發詞編譯成一個 regex：只比對訊息開頭，依 priority、再依觸發詞長度決定先後，不用再靠 if/elif 的順序。
+    有頻道限制的指令在比對前就先篩掉，每個頻道各自編譯一次並快取。"""
+
+    def __init__(self):
+        self.routes = []
+        self._compiled = {}  # 頻道 ID -> (regex, 觸發詞開頭字元)
+
+    def command(self, *triggers, priority=0, boundary=True, channels=None, slash=None, description=""):
+        def decorator(handler):
+            self.routes.append(Route(triggers, handler, priority, boundary,
+                                     frozenset(channels) if channels else None, slash, description))
+            self._compiled.clear()
+            return handler
+        return decorator
+
+    def compile(self, channel_id=None):
+        """編譯在這個頻道生效的指令"""
+        routes = [(index, route) for index, route in enumerate(self.routes)
+                  if route.channels is None or channel_id in route.channels]
+        parts = []
+        # priority 大的先，同 priority 時觸發詞長的先（「課程信件」要比「信」先試）；sorted 是穩定排序，其餘保持註冊順序
+        for index, route in sorted(routes, key=lambda item: (-item[1].priority, -max(map(len, item[1].triggers)))):
+            alternatives = "|".join(re.escape(trigger) for trigger in sorted(route.triggers, key=len, reverse=True))
+            tail = r"(?=\s|$)" if route.boundary else ""
+            parts.append(f"(?P<r{index}>{alternatives}){tail}")
+        pattern = re.compile(r"(?:" + "|".join(parts) + r")\s*(?P<args>.*)", re.IGNORECASE | re.DOTALL) if parts else None
+        # 開頭字元不是任何觸發詞的開頭時，連 regex 都不用跑
+        first_chars = {trigger[0].casefold() for _, route in routes for trigger in route.triggers}
+        self._compiled[channel_id] = pattern, first_chars
+        return pattern, first_chars
+
+    def match(self, content, channel_id=None):
+        """回傳 (route, 參數列表)，不是指令時回傳 None"""
+        pattern, first_chars = self._compiled.get(channel_id) or self.compile(channel_id)
+        content = content.lstrip()
+        if not content or content[0].casefold() not in first_chars:
+            return None
+        m = pattern.match(content)
+        if m is None:
+            return None
+        return self.routes[self._matched_index(m)], m["args"].split()
+
+    @staticmethod
+    def _matched_index(m):
+        for name, value in m.groupdict().items():
+            if name != "args" and value is not None:
+                return int(name[1:])
+
+    async def dispatch(self, message):
+        """訊息是指令就執行並回傳 True"""
+        found = self.match(message.content, message.channel.id)
+        if found is None:
+            return False
+        route, args = found
+        await route.handler(Invocation(message.author.id, message.channel, args, message.channel.send))
+        return True
+
+    def register_slash(self, tree):
+        """替有設定 slash 名稱的指令註冊 slash command（還需要 tree.sync() 才會出現在 Discord 上）"""
+        for route in self.routes:
+            if route.slash:
+                tree.add_command(self._slash_command(route))
+
+    def _slash_command(self, route):
+        async def callback(interaction: discord.Interaction, args: str = ""):
+            await interaction.response.defer(ephemeral=True, thinking=True)
+            replied = False
+
+            async def reply(text):
+                nonlocal replied
+                replied = True
+                await interaction.followup.send(text, ephemeral=True)
+
+            await route.handler(Invocation(interaction.user.id, interaction.channel, args.split(), reply))
+            if not replied:  # 結果發到其他頻道時，也要結束「思考中」的狀態
+                await interaction.followup.send("✅ 已完成", ephemeral=True)
+
+        return app_commands.Command(name=route.slash, description=route.description or route.triggers[0], callback=callback)
@@ -0,0 +1,119 @@
+import asyncio
+import time
+from collections import deque
+from metrics import DISCORD_SEND_SECONDS
+
+MESSAGE_LIMIT = 2000  # Discord 單則訊息的字數上限
+COALESCE_WINDOW = 0.3  # 同一個頻道在這段時間內排進來的訊息會合併送出
+CHANNEL_RATE = 5  # Discord 每個頻道大約每 5 秒最多 5 則訊息
+CHANNEL_PERIOD = 5
+
+
+def chunk_lines(lines, header="", limit=MESSAGE_LIMIT):
+    """把一行一行的紀錄裝進不超過 limit 字的訊息；header 只放在第一則。"""
+    chunk = header
+    for line in lines:
+        while len(line) > limit:  # 單行本身就超過上限，只能硬切
+            if chunk:
+                yield chunk
+                chunk = ""
+            yield line[:limit]
+            line = line[limit:]
+        if len(chunk) + len(line) > limit:
+            yield chunk
+            chunk = ""
+        chunk += line
+    if chunk:
+        yield chunk
+
+
+def pack_messages(texts, limit=MESSAGE_LIMIT):
+    """依序把多則短訊息合併成最少則數，每則不超過 limit 字（訊息之間換行分隔）。"""
+    packed = []
+    for text in texts:
+        for piece in chunk_lines([text], limit=limit):
+            if packed and len(packed[-1]) + 1 + len(piece) <= limit:
+                packed[-1] += "\n" + piece
+            else:
+                packed.append(piece)
+    return packed
+
+
+class Outbox:
+    """每個頻道一個送信佇列：短時間內排進來的文字合併、超長的切段，並依頻道限速送出。"""
+
+    def __init__(self, window=COALESCE_WINDOW, rate=CHANNEL_RATE, period=CHANNEL_PERIOD):
+        self.window = window
+        self.rate = rate
+        self.period = period
+        self._queues = {}  # 頻道 ID -> [(文字, future)]
+        self._workers = {}
+        self._sent = {}  # 頻道 ID -> 最近送出的時間
+        # 統計
+        self.queued = 0
+        self.api_calls = 0
+
+    async def send(self, channel, text):
+        """排進頻道佇列，等到真正送出後回傳是否成功。"""
+        return await self.send_lines(channel, [text])
+
+    async def send_lines(self, channel, lines, header=""):
+        """把多行紀錄切成不超過字數上限的訊息送出，取代在迴圈裡 += 再一次送出。"""
+        return await self.send_sections(channel, [(header, lines)])
+
+    async def send_sections(self, channel, sections):
+        """一次排入多段 (標題, 多行紀錄)，短的段落會合併成同一則訊息。"""
+        chunks = [chunk for header, lines in sections for chunk in chunk_lines(lines, header)]
+        if not chunks:
+            return True
+        loop = asyncio.get_running_loop()
+        futures = []
+        queue = self._queues.setdefault(channel.id, [])
+        for chunk in chunks:
+            future = loop.create_future()
+            queue.append((chunk, future))
+            futures.append(future)
+        self.queued += len(chunks)
+        worker = self._workers.get(channel.id)
+        if worker is None or worker.done():
+            self._workers[channel.id] = loop.create_task(self._drain(channel))
+        results = await asyncio.gather(*futures)
+        return all(results)
+
+    async def _drain(self, channel):
+        while self._queues.get(channel.id):
+            await asyncio.sleep(self.window)  # 等一下，讓同一批的訊息都排進來
+            batch = self._queues.pop(channel.id)
+            texts = [text for text, _ in batch]
+            ok = True
+            for message in pack_messages(texts):
+                await self._wait_turn(channel.id)
+                try:
+                    with DISCORD_SEND_SECONDS.time():
+                        await channel.send(message)
+                    self.api_calls += 1
+                except Exception as e:
+                    print(f"❌ 訊息傳送失敗（頻道 {channel.id}）：{e}")
+                    ok = False
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(ok)
+        self._workers.pop(channel.id, None)
+
+    async def _wait_turn(self, channel_id):
+        sent = self._sent.setdefault(channel_id, deque(maxlen=self.rate))
+        if len(sent) == self.rate:
+            delay = sent[0] + self.period - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        sent.append(time.monotonic())
+
+    def stats(self):
+        return {
+            "queued": self.queued,
+            "api_calls": self.api_calls,
+            "pending": sum(len(queue) for queue in self._queues.values())
+        }
+
+
+outbox = Outbox()
@@ -1,29 +1,23 @@
 import imaplib
-import email
 from email.header import decode_header
+from email.parser import BytesHeaderParser, BytesParser
+from email.utils import parsedate_to_datetime
+import html
 from dotenv import load_dotenv
 import os
 import socket
+import re
+import threading
+import atexit
+import time
+from contextlib import contextmanager
+from mail_cache import MailCache
+from mail_rules import load_classifier
+from metrics import IMAP_SECONDS
 
-TA_COURSE_TABLE = {
-     "林冠霆": "OOP",
-     "黃世強": "OOP",
-     "江仲恩": "OOP",
-     "黃睿帆": "微積分",
-     "姜鈞": "微積分",
-     "陳以潔": "生涯規劃與導師時間",
-     "吳雨勳": "生涯規劃與導師時間",
-     "王先正": "國防",
-     "嚴力行": "離散數學",
-     "鄭璟翰": "離散數學",
-     "林均宥": "離散數學",
-     "蔡淳仁": "數位電路設計",
-     "廖昶竣": "數位電路設計",
-     "葉家蓁": "服務學習：自由軟體推廣",
-     "ewant": "物理",
-     "鄭智仁": "體育",
-     "/": "未知QQ"
-}
+# 信件分類規則（課程、學校、購物…）從 mail_rules.json 載入
+classifier = load_classifier()
+TA_COURSE_TABLE = classifier.rule("course").patterns  # 助教 -> 課程
 
 # 設定全域 timeout（防止卡住）
 socket.setdefaulttimeout(10)
@@ -32,14 +26,111 @@ socket.setdefaulttimeout(10)
 load_dotenv()
 MY_GMAIL = os.getenv("MY_GMAIL")
 MY_GMAIL_PASSWORD = os.getenv("MY_GMAIL_PASSWORD")
+# 預設連 Gmail；benchmark 會改成連本機的假 IMAP 伺服器
+IMAP_HOST = os.getenv("IMAP_HOST", "imap.gmail.com")
+IMAP_PORT = int(os.getenv("IMAP_PORT", "993"))
+IMAP_SSL = os.getenv("IMAP_SSL", "1") == "1"
 
 # 建立連線
 def connect_to_gmail():
-    mail = imaplib.IMAP4_SSL("imap.gmail.com")
-    mail.login(MY_GMAIL, MY_GMAIL_PASSWORD)
-    mail.select("inbox")
+    with IMAP_SECONDS.time(op="connect"):
+        mail = imaplib.IMAP4_SSL(IMAP_HOST, IMAP_PORT) if IMAP_SSL else imaplib.IMAP4(IMAP_HOST, IMAP_PORT)
+        mail.login(MY_GMAIL, MY_GMAIL_PASSWORD)
+        # 登入後的能力清單才完整（例如 Gmail 的 X-GM-EXT-1）
+        status, data = mail.capability()
+        if status == "OK":
+            mail.capabilities = tuple(data[-1].decode().upper().split())
+        mail.select("inbox")
     return mail
 
+# 連線池：保留已登入的 IMAP 連線，避免每次搜尋都重新 TLS 握手 + LOGIN + SELECT
+class GmailConnectionPool:
+    def __init__(self, max_size=4, noop_interval=30):
+        self.max_size = max_size
+        self.noop_interval = noop_interval  # 閒置超過這個秒數才用 NOOP 檢查連線
+        self._idle = []  # [(mail, 上次使用時間)]
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self.last_success = None  # 最後一次成功 / 失敗的時間（time.time()），給健康檢查用
+        self.last_error = None
+
+    def _is_alive(self, mail, last_used):
+        if time.monotonic() - last_used < self.noop_interval:
+            return True
+        try:
+            status, _ = mail.noop()
+            return status == "OK"
+        except (imaplib.IMAP4.error, OSError):  # IMAP4.abort（BYE）也是 IMAP4.error
+            return False
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                mail, last_used = self._idle.pop()
+            if self._is_alive(mail, last_used):
+                return mail
+            self._discard(mail)
+        return connect_to_gmail()
+
+    def _checkin(self, mail):
+        with self._lock:
+            self._idle.append((mail, time.monotonic()))
+
+    def _discard(self, mail):
+        try:
+            mail.logout()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self):
+        """借出一條已登入並 SELECT inbox 的連線，用完自動歸還"""
+        self._slots.acquire()
+        mail = None
+        try:
+            mail = self._checkout()
+            yield mail
+        except (imaplib.IMAP4.abort, OSError):
+            # 連線逾時或被伺服器 BYE，這條連線不能再用
+            if mail is not None:
+                self._discard(mail)
+                mail = None
+            raise
+        finally:
+            if mail is not None:
+                self._checkin(mail)
+            self._slots.release()
+
+    def run(self, func):
+        """用池中的連線執行 func(mail)，連線中途斷掉時換一條新連線重試一次"""
+        try:
+            result = self._run(func)
+        except Exception:
+            self.last_error = time.time()
+            raise
+        self.last_success = time.time()
+        return result
+
+    def _run(self, func):
+        try:
+            with self.connection() as mail:
+                return func(mail)
+        except (imaplib.IMAP4.abort, OSError) as e:
+            print(f"⚠️ IMAP 連線中斷，重新連線：{e}")
+            with self.connection() as mail:
+                return func(mail)
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for mail, _ in idle:
+            self._discard(mail)
+
+pool = GmailConnectionPool()
+atexit.register(pool.close_all)
+
 # 解碼函數，處理亂碼
 def decode_mime_words(s):
     decoded = decode_header(s)
@@ -48,87 +139,473 @@ def decode_mime_words(s):
         for part in decoded
     )
 
-# 搜尋關鍵字（從最新的 num_emails 封信件中找）
-def search_emails(keyword, num_emails=10):
-    try:
-        mail = connect_to_gmail()
-        status, messages = mail.search(None, "ALL")
-        email_ids = messages[0].split()
-        latest_ids = email_ids[-num_emails:]
+_MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
 
-        matching_emails = []
-        for eid in reversed(latest_ids):  # 從最新到舊
+# IMAP SEARCH 的日期格式（例如 01-Jan-2025），不受系統語系影響
+def imap_date(d):
+    return f"{d.day:02d}-{_MONTHS[d.month - 1]}-{d.year}"
+
+def _quote(s):
+    return '"' + s.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+# IMAP 的 OR 只吃兩個條件，多個條件要巢狀：OR a OR b c
+def _or_chain(terms):
+    if len(terms) == 1:
+        return terms[0]
+    return f"OR {terms[0]} {_or_chain(terms[1:])}"
+
+def _uid_search(mail, criteria, literal=None):
+    with IMAP_SECONDS.time(op="search"):
+        if literal is not None:
+            mail.literal = literal.encode("utf-8")  # imaplib 會把 literal 接在指令最後面
+            status, data = mail.uid("SEARCH", "CHARSET", "UTF-8", *criteria)
+        else:
+            status, data = mail.uid("SEARCH", *criteria)
+    if status != "OK":
+        raise imaplib.IMAP4.error(f"SEARCH 失敗：{data}")
+    return {int(uid) for uid in data[0].split()}
+
+# 把關鍵字 / 寄件人 / 日期區間交給伺服器搜尋，只回傳符合的 UID（由舊到新）
+# keyword 比對寄件人或主旨；sender 可以是字串或多個寄件人（任一符合即可）；兩者同時給時須都符合
+# within 有給時只在最新的 within 封信中搜尋
+def search_uids(mail, keyword=None, sender=None, since=None, before=None, within=None):
+    senders = [sender] if isinstance(sender, str) else list(sender or [])
+    groups = []  # 每組內任一條件符合即可（OR），各組之間都要符合（AND）
+    if senders:
+        groups.append([("FROM", s) for s in senders])
+    if keyword:
+        groups.append([("FROM", keyword), ("SUBJECT", keyword)])
+
+    dates = []
+    if since:
+        dates += ["SINCE", imap_date(since)]
+    if before:
+        dates += ["BEFORE", imap_date(before)]
+    if within:
+        latest = sorted(_uid_search(mail, ["ALL"]))[-within:]
+        if not latest:
+            return []
+        dates += ["UID", f"{latest[0]}:*"]
+
+    if not groups:
+        return sorted(_uid_search(mail, dates or ["ALL"]))
+
+    if "X-GM-EXT-1" in mail.capabilities:
+        # Gmail：整個條件用一個 X-GM-RAW 查詢，只需一次來回
+        raw = " ".join(
+            "{" + " ".join(f'{field.lower()}:"{value.replace(chr(34), "")}"' for field, value in group) + "}"
+            for group in groups
+        )
+        return sorted(_uid_search(mail, dates + ["X-GM-RAW"], raw))
+
+    result = None
+    for group in groups:
+        if all(value.isascii() for _, value in group):
+            matched = _uid_search(mail, dates + [_or_chain([f"{field} {_quote(value)}" for field, value in group])])
+        else:
+            # 非 ASCII 要用 literal 傳送，而 imaplib 一個指令只能帶一個 literal，只好每個條件各搜一次
+            matched = set()
+            for field, value in group:
+                matched |= _uid_search(mail, dates + [field], value)
+        result = matched if result is None else result & matched
+    return sorted(result)
+
+# 只抓這幾個標頭就夠用了，PEEK 不會把信標成已讀
+HEADER_FIELDS = "BODY.PEEK[HEADER.FIELDS (SUBJECT FROM DATE MESSAGE-ID)]"
+FETCH_CHUNK = 500  # 每個 FETCH 指令最多帶幾個 UID，避免指令列過長
+
+_header_parser = BytesHeaderParser()
+
+# 把 UID 壓成 IMAP sequence set，例如 [1, 2, 3, 7] -> "1:3,7"
+def uid_set(uids):
+    uids = sorted(uids)
+    ranges = []
+    start = prev = uids[0]
+    for uid in uids[1:]:
+        if uid != prev + 1:
+            ranges.append(f"{start}:{prev}" if start != prev else str(start))
+            start = uid
+        prev = uid
+    ranges.append(f"{start}:{prev}" if start != prev else str(start))
+    return ",".join(ranges)
+
+# 把一段只有標頭的原始資料解析成信件資料
+def parse_headers(uid, raw):
+    msg = _header_parser.parsebytes(raw)
+    return {
+        "UID": uid,
+        "From": decode_mime_words(msg.get("From", "")),
+        "Subject": decode_mime_words(msg.get("Subject", "")),
+        "Date": msg.get("Date"),
+        "Message-ID": msg.get("Message-ID")
+    }
+
+# 把 FETCH 的回應依開頭的序號分組成一封一封的信：{"uid", "header", "body"}
+# UID 可能在 literal 前面（b'1 (UID 5 BODY[...] {n}'），也可能在後面（b' UID 5)'），兩種都要認得
+def split_fetch_response(data):
+    messages = []
+    for item in data:
+        meta = item[0] if isinstance(item, tuple) else item
+        if re.match(rb"\d+ \(", meta):
+            messages.append({"uid": None, "header": b"", "body": b""})
+        if not messages:
+            continue
+        current = messages[-1]
+        match = re.search(rb"UID (\d+)", meta)
+        if match:
+            current["uid"] = int(match.group(1))
+        if isinstance(item, tuple):
+            current["header" if b"HEADER.FIELDS" in meta else "body"] = item[1]
+    return [message for message in messages if message["uid"] is not None]
+
+# 一次 UID FETCH 取回多封信的標頭（不下載內文和附件），回傳依 UID 由舊到新排序的信件資料
+def fetch_headers(mail, uids):
+    uids = sorted(uids)
+    records = []
+    for i in range(0, len(uids), FETCH_CHUNK):
+        with IMAP_SECONDS.time(op="fetch"):
+            status, data = mail.uid("FETCH", uid_set(uids[i:i + FETCH_CHUNK]), f"(UID {HEADER_FIELDS})")
+        if status != "OK":
+            print(f"⚠️ 無法讀取信件標頭：{data}")
+            continue
+
+        for message in split_fetch_response(data):
             try:
-                status, data = mail.fetch(eid, "(RFC822)")
-                if status != "OK":
-                    print(f"⚠️ 無法讀取 email ID {eid}")
-                    continue
-
-                msg = email.message_from_bytes(data[0][1])
-                subject = decode_mime_words(msg["Subject"])
-                from_ = decode_mime_words(msg.get("From"))
-                date = msg.get("Date")
-
-                if keyword in subject or keyword in from_:
-                    matching_emails.append({
-                        "From": from_,
-                        "Subject": subject,
-                        "Date": date
-                    })
+                records.append(parse_headers(message["uid"], message["header"]))
+            except Exception as e:
+                print(f"❌ 處理信件 UID {message['uid']} 時發生錯誤：{e}")
+    records.sort(key=lambda record: record["UID"])
+    return records
 
+# 全文索引用：標頭加上內文的前 BODY_PREVIEW 位元組（partial fetch，不會下載大型附件）
+BODY_PREVIEW = 32 * 1024
+BODY_LIMIT = 10000  # 每封信最多存多少字的內文
+MESSAGE_FIELDS = ("BODY.PEEK[HEADER.FIELDS (SUBJECT FROM DATE MESSAGE-ID CONTENT-TYPE CONTENT-TRANSFER-ENCODING MIME-VERSION)] "
+                  f"BODY.PEEK[TEXT]<0.{BODY_PREVIEW}>")
+MESSAGE_FETCH_CHUNK = 100
+
+_message_parser = BytesParser()  # compat32：不經過 headerregistry，比 policy.default 快約 10 倍，內文自己解碼
+
+# 從（可能被截斷的）信件中取出純文字內文，只有 HTML 時去掉標籤
+def extract_text(header_raw, body_raw):
+    msg = _message_parser.parsebytes(header_raw + body_raw)
+    plain, rich = [], []
+    for part in msg.walk():
+        if part.is_multipart() or part.get_filename():
+            continue
+        content_type = part.get_content_type()
+        if content_type not in ("text/plain", "text/html"):
+            continue
+        payload = part.get_payload(decode=True) or b""  # 被截斷的 base64 等等也會盡量解碼
+        try:
+            text = payload.decode(part.get_content_charset() or "utf-8", "replace")
+        except LookupError:  # 不認得的 charset
+            text = payload.decode("utf-8", "replace")
+        (plain if content_type == "text/plain" else rich).append(text)
+    text = "\n".join(plain)
+    if not text and rich:
+        text = html.unescape(re.sub(r"<(script|style)\b.*?</\1>|<[^>]+>", " ", "\n".join(rich), flags=re.S | re.I))
+    return " ".join(text.split())[:BODY_LIMIT]
+
+def timestamp_of(date):
+    try:
+        return parsedate_to_datetime(date).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+# 一次 UID FETCH 取回多封信的標頭和內文預覽，回傳依 UID 由舊到新排序、多了 Body 和 ts 的信件資料。
+# FETCH 失敗時丟出 IMAP4.error，不會只回傳一部分，呼叫端才不會把沒拿到的信當成已經處理過
+def fetch_messages(mail, uids):
+    uids = sorted(uids)
+    records = []
+    for i in range(0, len(uids), MESSAGE_FETCH_CHUNK):
+        with IMAP_SECONDS.time(op="fetch"):
+            status, data = mail.uid("FETCH", uid_set(uids[i:i + MESSAGE_FETCH_CHUNK]), f"(UID {MESSAGE_FIELDS})")
+        if status != "OK":
+            raise imaplib.IMAP4.error(f"FETCH 失敗：{data}")
+
+        # 每封信會有兩段 literal（標頭、內文）
+        for message in split_fetch_response(data):
+            try:
+                record = parse_headers(message["uid"], message["header"])
+                record["Body"] = extract_text(message["header"], message["body"])
+                record["ts"] = timestamp_of(record["Date"])
+                records.append(record)
             except Exception as e:
-                print(f"❌ 處理信件 ID {eid} 時發生錯誤：{e}")
-                continue
+                # 解析失敗的信也留一筆空白紀錄，否則這個 UID 每次同步都會被當成沒拿到
+                print(f"❌ 處理信件 UID {message['uid']} 時發生錯誤：{e}")
+                records.append({"UID": message["uid"], "From": "", "Subject": "", "Date": None,
+                                "Message-ID": None, "Body": "", "ts": None})
+    records.sort(key=lambda record: record["UID"])
+    return records
 
-        mail.logout()
-        return matching_emails
+# 依 UID 由舊到新數到第一封沒存進快取的信（例如在 SEARCH 和 FETCH 之間被刪掉），回傳可以安全標成已同步的 UID
+def stored_through(start, uids, records):
+    stored = {record["UID"] for record in records}
+    for uid in sorted(uids):
+        if uid not in stored:
+            break
+        start = uid
+    return start
+
+# 搜尋關鍵字：整個信箱都收進全文索引後直接在本機查詢（依相關度排序），
+# 還沒收完（或有給 within，只找最新的 within 封信）時改成在伺服器端搜尋，回傳最新的 num_emails 封符合的信件
+def search_emails(keyword, num_emails=10, sender=None, since=None, before=None, within=None):
+    cache = get_cache()
 
+    def search(mail):
+        _sync(mail, cache)  # 先把新進的信收進索引
+        if cache.archive_complete() and not within:
+            senders = [sender] if isinstance(sender, str) else sender
+            return cache.search(keyword, senders, since, before, num_emails)
+
+        uids = search_uids(mail, keyword=keyword, sender=sender, since=since, before=before, within=within)
+        if not uids:
+            return []
+        return list(reversed(fetch_headers(mail, uids[-num_emails:])))  # 從最新到舊
+
+    try:
+        return pool.run(search)
     except Exception as e:
         print(f"❌ Gmail 連線或搜尋失敗：{e}")
         return []
 
+# 依寄件人判斷是哪一門課的信，不是課程信件則回傳 None
+def course_of(from_):
+    return classifier.classify({"From": from_}).get("course")
+
 def search_course_emails(num_emails=10):
-    try:
-        keyword = "/"
-        mail = connect_to_gmail()
-        status, messages = mail.search(None, "ALL")
-        email_ids = messages[0].split()
-        latest_ids = email_ids[-num_emails:]
+    cache = get_cache()
 
-        matching_emails = []
-        for eid in reversed(latest_ids):  # 從最新到舊
-            try:
-                status, data = mail.fetch(eid, "(RFC822)")
-                if status != "OK":
-                    print(f"⚠️ 無法讀取 email ID {eid}")
-                    continue
-
-                msg = email.message_from_bytes(data[0][1])
-                subject = decode_mime_words(msg["Subject"])
-                from_ = decode_mime_words(msg.get("From"))
-                date = msg.get("Date")
-
-                for name, course in TA_COURSE_TABLE.items():
-                    if name in from_:
-                        matching_emails.append({
-                            "From": from_,
-                            "Subject": subject,
-                            "Date": date,
-                            "Course": course
-                        })
-                        break  # 找到就跳出
+    def search(mail):
+        _sync(mail, cache)
+        if cache.archive_complete():
+            # 整個信箱中最新的 num_emails 封課程信件
+            return [{**record, "Course": course_of(record["From"])}
+                    for record in cache.search(senders=list(TA_COURSE_TABLE), limit=num_emails)
+                    if course_of(record["From"])]
 
-            except Exception as e:
-                print(f"❌ 處理信件 ID {eid} 時發生錯誤：{e}")
-                continue
+        uids = search_uids(mail)
+        if not uids:
+            return []
 
-        mail.logout()
+        matching_emails = []
+        for record in reversed(fetch_headers(mail, uids[-num_emails:])):  # 從最新到舊
+            course = course_of(record["From"])
+            if course:
+                matching_emails.append({**record, "Course": course})
         return matching_emails
 
+    try:
+        return pool.run(search)
     except Exception as e:
         print(f"❌ Gmail 連線或搜尋失敗：{e}")
         return []
 
+FIRST_SYNC_WINDOW = 30  # 第一次同步時先記下最新的幾封信當作基準
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = MailCache()
+        return _cache
+
+# 一次 STATUS 取得 (UIDVALIDITY, UIDNEXT)
+def mailbox_status(mail, mailbox="INBOX"):
+    with IMAP_SECONDS.time(op="status"):
+        status, data = mail.status(mailbox, "(UIDNEXT UIDVALIDITY)")
+    if status != "OK":
+        raise imaplib.IMAP4.error(f"STATUS 失敗：{data}")
+    values = dict(re.findall(rb"(UIDNEXT|UIDVALIDITY) (\d+)", data[0]))
+    return int(values[b"UIDVALIDITY"]), int(values[b"UIDNEXT"])
+
+# 把伺服器上比快取還新的信件標頭抓進快取，回傳 UIDVALIDITY 和目前同步到的最大 UID
+def _sync(mail, cache):
+    uidvalidity, uidnext = mailbox_status(mail)
+    if cache.uidvalidity() != uidvalidity:
+        cache.reset(uidvalidity)
+
+    synced = cache.get_mark("sync")
+    if synced is None:
+        # 第一次同步：只記下最新的幾封當基準，不把整個信箱都當成新信
+        uids = search_uids(mail)
+        records = fetch_messages(mail, uids[-FIRST_SYNC_WINDOW:])
+        cache.store(uidvalidity, records)
+        cache.archive(records)
+        # 比基準更舊的信由 mail_backfill 分段平行收進索引
+        cache.set_mark("archive_low", uidvalidity, uids[-FIRST_SYNC_WINDOW] if len(uids) > FIRST_SYNC_WINDOW else 0)
+        synced = uids[-1] if uids else 0
+        # 還沒有紀錄的 consumer 從這裡開始報，快取建立（bot 啟動）之後進來的信都不會漏掉
+        cache.set_mark("baseline", uidvalidity, synced)
+    elif uidnext - 1 > synced:
+        with IMAP_SECONDS.time(op="search"):
+            status, data = mail.uid("SEARCH", f"UID {synced + 1}:*")
+        if status != "OK":
+            raise imaplib.IMAP4.error(f"SEARCH 失敗：{data}")
+        # n:* 在沒有更新的信時仍會回傳最大的 UID，要自己濾掉
+        uids = [uid for uid in map(int, data[0].split()) if uid > synced]
+        if uids:
+            records = fetch_messages(mail, uids)
+            cache.store(uidvalidity, records)
+            cache.archive(records)
+            # 只往前移到連續都存進快取的 UID；沒拿到的信下次同步會再抓一次
+            synced = stored_through(synced, uids, records)
+    cache.set_mark("sync", uidvalidity, synced)
+    return uidvalidity, synced
+
+# 啟動時先建立 IMAP 連線並把新信標頭同步進快取（不會動到任何 consumer 看到哪裡）
+def warm_up():
+    cache = get_cache()
+    pool.run(lambda mail: _sync(mail, cache))
+
+CATCH_UP_LIMIT = 200  # 從外部存的位置接著報時，最多補抓幾封
+
+# 本機快取沒有 consumer 的紀錄時（例如 Render 重新部署清掉了磁碟）決定從哪一封之後開始報：
+# resume 是存在別處（Notion）的 (UIDVALIDITY, UID)，有效的話把那之後、快取裡還沒有的信補抓進來；否則從第一次同步的基準開始
+def _resume_from(mail, cache, uidvalidity, synced, resume):
+    baseline = cache.get_mark("baseline")
+    if baseline is None:  # 有基準紀錄之前建立的快取
+        baseline = synced
+    if not resume or resume[0] != uidvalidity:  # 信箱重建過，舊的 UID 沒有意義
+        return baseline
+    seen = min(resume[1], synced)
+    if seen >= baseline:
+        return seen
+    # 停機期間進來、比基準舊的信，快取裡還沒有
+    uids = sorted(uid for uid in _uid_search(mail, ["UID", f"{seen + 1}:{baseline}"]) if seen < uid <= baseline)
+    if not uids:
+        return seen
+    uids = uids[-CATCH_UP_LIMIT:]
+    records = fetch_messages(mail, uids)
+    cache.store(uidvalidity, records)
+    cache.archive(records)
+    return uids[0] - 1
+
+# 增量同步：回傳 (consumer 上次看到之後新進的信（由舊到新）, 看完這些信之後的位置 (UIDVALIDITY, UID))，
+# 不會移動 consumer 的紀錄，呼叫端把信送出去之後再用 advance_consumer 記下來；同步失敗時位置是 None。
+# 沒有新信時只需要一次 STATUS。第一次呼叫時從 resume 或第一次同步的基準開始，不會把整個信箱都當成新信。
+def peek_new_emails(consumer="digest", resume=None):
+    cache = get_cache()
+
+    def sync(mail):
+        uidvalidity, synced = _sync(mail, cache)
+        seen = cache.get_mark(consumer)
+        if seen is None:
+            seen = _resume_from(mail, cache, uidvalidity, synced, resume)
+        return uidvalidity, synced, seen
+
+    try:
+        uidvalidity, synced, seen = pool.run(sync)
+    except Exception as e:
+        print(f"❌ Gmail 同步失敗：{e}")
+        return [], None
+
+    return cache.headers_after(uidvalidity, seen, synced), (uidvalidity, synced)
+
+def advance_consumer(consumer, mark):
+    if mark is not None:
+        get_cache().set_mark(consumer, *mark)
+
+# 同上，但馬上把 consumer 的紀錄移到最後，只回傳新信
+def sync_new_emails(consumer="digest", resume=None):
+    records, mark = peek_new_emails(consumer, resume)
+    advance_consumer(consumer, mark)
+    return records
+
+IDLE_TIMEOUT = 25 * 60  # Gmail 大約 29 分鐘會中斷 IDLE，提早結束再重新送出
+POLL_INTERVAL = 5 * 60  # 伺服器不支援 IDLE 時，改成每隔一段時間檢查一次
+
+# 從 socket 直接讀一行（不經過 imaplib 的緩衝區，逾時才不會弄壞連線），超過 deadline 丟出 socket.timeout
+def _read_line(sock, buf, deadline):
+    while b"\r\n" not in buf:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise socket.timeout("IDLE 等待逾時")
+        sock.settimeout(remaining)
+        chunk = sock.recv(4096)
+        if not chunk:
+            raise imaplib.IMAP4.abort("伺服器關閉了連線")
+        buf += chunk
+    index = buf.index(b"\r\n")
+    line = bytes(buf[:index])
+    del buf[:index + 2]
+    if line.startswith(b"* BYE"):
+        raise imaplib.IMAP4.abort(line.decode(errors="replace"))
+    return line
+
+# 送出 IDLE 等伺服器推播，收到 EXISTS（有新信）或超過 timeout 秒就送 DONE 結束；有新信時回傳 True
+def idle_wait(mail, timeout=IDLE_TIMEOUT):
+    tag = mail._new_tag()
+    mail.tagged_commands.pop(tag, None)  # 這個指令自己處理回應，不交給 imaplib
+    sock = mail.socket()
+    command_timeout = sock.gettimeout() or 10
+    buf = bytearray()
+    has_new = False
+    try:
+        sock.sendall(tag + b" IDLE\r\n")
+        line = _read_line(sock, buf, time.monotonic() + command_timeout)
+        if not line.startswith(b"+"):
+            raise imaplib.IMAP4.error(f"IDLE 失敗：{line.decode(errors='replace')}")
+
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                line = _read_line(sock, buf, deadline)
+            except socket.timeout:
+                break
+            if line.endswith(b"EXISTS"):
+                has_new = True
+                break
+
+        sock.sendall(b"DONE\r\n")
+        while True:
+            line = _read_line(sock, buf, time.monotonic() + command_timeout)
+            if line.endswith(b"EXISTS"):
+                has_new = True
+            elif line.startswith(tag):
+                if not line[len(tag):].lstrip().startswith(b"OK"):
+                    raise imaplib.IMAP4.error(f"IDLE 結束失敗：{line.decode(errors='replace')}")
+                break
+    finally:
+        sock.settimeout(command_timeout)
+    return has_new
+
+# 長駐監看信箱：用一條獨立連線 IDLE，有新信就同步並呼叫 on_new(新信列表)，直到 stop（threading.Event）被設定
+def watch_new_emails(on_new, stop, consumer="push"):
+    # 沒有紀錄時從第一次同步的基準開始，啟動到開始監看之間進來的信也會通知
+    records = sync_new_emails(consumer)
+    if records:
+        on_new(records)
+    mail = None
+    backoff = 5
+    while not stop.is_set():
+        try:
+            if mail is None:
+                mail = connect_to_gmail()
+            if "IDLE" in mail.capabilities:
+                idle_wait(mail)
+            else:
+                stop.wait(POLL_INTERVAL)
+            # 不管是收到通知還是 IDLE 到期都同步一次，沒有新信時只花一次 STATUS
+            records = sync_new_emails(consumer)
+            if records:
+                on_new(records)
+            backoff = 5
+        except Exception as e:
+            print(f"⚠️ IDLE 監看中斷，{backoff} 秒後重新連線：{e}")
+            if mail is not None:
+                pool._discard(mail)
+                mail = None
+            stop.wait(backoff)
+            backoff = min(backoff * 2, 300)
+
+    if mail is not None:
+        pool._discard(mail)
+
 # 測試用
 if __name__ == "__main__":
     keyword = "/"
@@ -0,0 +1,91 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import gmail_api
+import mail_backfill
+
+# gmail_api 的非同步版本：imaplib 是阻塞式的，所以丟到獨立的執行緒池跑，
+# 不會卡住 Discord 的 event loop。執行緒數和連線池一樣大，多個查詢可以同時進行。
+_executor = ThreadPoolExecutor(max_workers=gmail_api.pool.max_size, thread_name_prefix="gmail")
+
+DEFAULT_TIMEOUT = 60  # 秒
+
+async def run_in_gmail_thread(func, *args, timeout=DEFAULT_TIMEOUT, **kwargs):
+    """在 Gmail 執行緒池中執行 func，逾時會丟出 asyncio.TimeoutError。
+    被取消或逾時時，背景的 IMAP 指令仍會跑完（受 socket timeout 限制），連線會正常歸還連線池。"""
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+    return await asyncio.wait_for(future, timeout)
+
+async def search_emails(keyword, num_emails=10, timeout=DEFAULT_TIMEOUT, **kwargs):
+    try:
+        return await run_in_gmail_thread(gmail_api.search_emails, keyword, num_emails, timeout=timeout, **kwargs)
+    except asyncio.TimeoutError:
+        print(f"❌ Gmail 搜尋 `{keyword}` 逾時（{timeout} 秒）")
+        return []
+
+async def search_course_emails(num_emails=10, timeout=DEFAULT_TIMEOUT):
+    try:
+        return await run_in_gmail_thread(gmail_api.search_course_emails, num_emails, timeout=timeout)
+    except asyncio.TimeoutError:
+        print(f"❌ Gmail 搜尋課程信件逾時（{timeout} 秒）")
+        return []
+
+async def sync_new_emails(consumer="digest", resume=None, timeout=DEFAULT_TIMEOUT):
+    try:
+        return await run_in_gmail_thread(gmail_api.sync_new_emails, consumer, resume, timeout=timeout)
+    except asyncio.TimeoutError:
+        print(f"❌ Gmail 同步逾時（{timeout} 秒）")
+        return []
+
+async def peek_new_emails(consumer="digest", resume=None, timeout=DEFAULT_TIMEOUT):
+    try:
+        return await run_in_gmail_thread(gmail_api.peek_new_emails, consumer, resume, timeout=timeout)
+    except asyncio.TimeoutError:
+        print(f"❌ Gmail 同步逾時（{timeout} 秒）")
+        return [], None
+
+async def advance_consumer(consumer, mark):
+    await run_in_gmail_thread(gmail_api.advance_consumer, consumer, mark)
+
+async def warm_up(timeout=DEFAULT_TIMEOUT):
+    await run_in_gmail_thread(gmail_api.warm_up, timeout=timeout)
+
+async def backfill_archive(retry=60):
+    """背景把整個信箱收進全文索引（mail_backfill，多條連線平行抓取），失敗的段落隔一段時間再試，全部收完就結束。
+    會花上好幾分鐘，所以用獨立的執行緒，不佔用上面的執行緒池"""
+    while True:
+        stop = threading.Event()
+        try:
+            result = await asyncio.to_thread(mail_backfill.backfill_mailbox, stop=stop)
+        except Exception as e:
+            print(f"❌ 信箱收錄失敗：{e}")
+            result = None
+        finally:
+            stop.set()  # 被取消時讓工作執行緒做完手上的段落就停
+        if result is not None:
+            if result["remaining"] == 0:
+                if result["messages"]:
+                    print(f"📚 信箱已全部收進全文索引（這次收錄 {result['messages']} 封，{result['seconds']:.1f} 秒）")
+                return
+            print(f"📚 全文索引還有 {result['remaining']} 段沒收完，{retry} 秒後再試")
+        await asyncio.sleep(retry)
+
+async def watch_new_emails(consumer="push"):
+    """async generator：每當 IMAP IDLE 通知有新信，就 yield 一批新信（由舊到新）。
+    IDLE 連線會一直佔著，所以用獨立的執行緒，不佔用上面的執行緒池。"""
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def on_new(records):
+        loop.call_soon_threadsafe(queue.put_nowait, records)
+
+    thread = threading.Thread(target=gmail_api.watch_new_emails, args=(on_new, stop, consumer), name="gmail-idle", daemon=True)
+    thread.start()
+    try:
+        while True:
+            yield await queue.get()
+    finally:
+        stop.set()
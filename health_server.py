@@ -0,0 +1,57 @@
+import json
+import os
+from aiohttp import web
+from metrics import render as render_metrics
+
+# 健康檢查伺服器：跑在 bot 自己的 event loop 上（aiohttp），不用另外開 Flask 執行緒。
+# / 回報每一項檢查的狀態，必要的檢查有一項失敗就回 503，讓平台（Render）重新啟動 bot
+PORT = int(os.getenv("PORT", "8080"))
+
+class HealthServer:
+    def __init__(self, host="0.0.0.0", port=PORT):
+        self.host = host
+        self.port = port
+        self.checks = []  # [(名稱, 檢查函式, 是否必要)]
+        self._runner = None
+
+    def check(self, name, critical=True):
+        """註冊檢查函式：回傳 (是否正常, 說明)；critical=False 的只回報、不影響狀態碼"""
+        def decorator(func):
+            self.checks.append((name, func, critical))
+            return func
+        return decorator
+
+    def report(self):
+        healthy = True
+        results = {}
+        for name, func, critical in self.checks:
+            try:
+                ok, detail = func()
+            except Exception as e:
+                ok, detail = False, f"檢查失敗：{e!r}"
+            results[name] = {"ok": ok, "critical": critical, "detail": detail}
+            if critical and not ok:
+                healthy = False
+        return healthy, results
+
+    async def _index(self, request):
+        healthy, results = self.report()
+        body = json.dumps({"status": "ok" if healthy else "unhealthy", "checks": results}, ensure_ascii=False, indent=2)
+        return web.Response(text=body, status=200 if healthy else 503, content_type="application/json")
+
+    async def _metrics(self, request):
+        return web.Response(text=render_metrics(), content_type="text/plain")
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/", self._index)
+        app.router.add_get("/metrics", self._metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        print(f"🩺 健康檢查伺服器啟動：http://{self.host}:{self.port}/")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
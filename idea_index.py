@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import unicodedata
+from notion_mirror import page_title, page_text
+
+# 靈感的本機索引：存成 JSON，啟動時不用等 Notion 就能列出靈感；重複檢查用正規化後的雜湊查表
+IDEA_INDEX_PATH = os.getenv("IDEA_INDEX_PATH", "idea_index.json")
+
+def normalize(text):
+    """全形半形、大小寫、多餘空白都視為相同"""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+def text_hash(text):
+    return hashlib.sha1(normalize(text).encode("utf-8")).hexdigest()
+
+class IdeaIndex:
+    def __init__(self, path=IDEA_INDEX_PATH):
+        self.path = path
+        self.ideas = {}  # page_id -> {"id", "title", "content", "created"}
+        self.by_title = {}  # 標題雜湊 -> page_id
+        self.by_content = {}  # 內容雜湊 -> page_id
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"❌ 靈感索引讀取失敗，等 Notion 載入後重建：{e}")
+            return
+        for entry in entries:
+            self._index(entry)
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.items_raw(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)  # 寫到一半當掉也不會留下壞掉的檔案
+
+    def _index(self, entry):
+        self._unindex(entry["id"])
+        self.ideas[entry["id"]] = entry
+        self.by_title[text_hash(entry["title"])] = entry["id"]
+        self.by_content[text_hash(entry["content"])] = entry["id"]
+
+    def _unindex(self, page_id):
+        entry = self.ideas.pop(page_id, None)
+        if entry is None:
+            return
+        for table, text in ((self.by_title, entry["title"]), (self.by_content, entry["content"])):
+            key = text_hash(text)
+            if table.get(key) == page_id:
+                del table[key]
+
+    @staticmethod
+    def entry_of(page):
+        return {
+            "id": page["id"],
+            "title": page_title(page),
+            "content": page_text(page, "content"),
+            "created": page.get("created_time", "")
+        }
+
+    def add_page(self, page):
+        self._index(self.entry_of(page))
+        self.save()
+
+    def remove(self, page_ids):
+        for page_id in page_ids:
+            self._unindex(page_id)
+        self.save()
+
+    def rebuild(self, pages):
+        """用 Notion 鏡像的頁面重建；內容沒變就不寫檔"""
+        entries = [self.entry_of(page) for page in pages]
+        if entries == self.items_raw():
+            return
+        self.ideas.clear()
+        self.by_title.clear()
+        self.by_content.clear()
+        for entry in entries:
+            self._index(entry)
+        self.save()
+
+    def find_duplicate(self, content):
+        """整段內容和現有靈感的內容或標題完全相同時，回傳那個靈感的標題（只有前 40 字相同不算重複）"""
+        page_id = self.by_content.get(text_hash(content)) or self.by_title.get(text_hash(content))
+        return self.ideas[page_id]["title"] if page_id else None
+
+    def items_raw(self):
+        return sorted(self.ideas.values(), key=lambda entry: entry["created"])
+
+    def items(self):
+        """[(page_id, 標題, 內容)]，依建立時間排序"""
+        return [(entry["id"], entry["title"], entry["content"]) for entry in self.items_raw()]
+
+idea_index = IdeaIndex()
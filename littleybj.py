@@ -1,30 +1,26 @@
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord.ui import Button, View, Select, Modal, TextInput
 import os
 import time
 import dotenv
-import requests
-import aiohttp
 import asyncio
-import datetime
-from zoneinfo import ZoneInfo
-import threading
-from flask import Flask
+import math
 from dataclasses import dataclass
-from gmail_api import search_emails, search_course_emails
-
-# 騙過Render用的Flask(防止Render一直重新部署)，實際上bot用不到
-app = Flask(__name__)
-
-@app.route("/")
-def index():
-    return "LittleYBJ is running!"
-
-def run_web():
-    app.run(host='0.0.0.0', port=8080)
-
-threading.Thread(target=run_web).start()
+from timer_scheduler import TimerScheduler, TAIPEI
+from gmail_async import search_emails, search_course_emails, peek_new_emails, advance_consumer, watch_new_emails
+from gmail_async import warm_up as gmail_warm_up, backfill_archive
+import mail_backfill
+from discord_outbox import outbox
+from idea_index import idea_index
+from command_router import CommandRouter
+import datetime
+from metrics import TIMER_SKEW_SECONDS, MAIL_SCANNED
+from health_server import HealthServer
+from loop_monitor import loop_monitor
+from gmail_api import classifier, pool as gmail_pool, get_cache as gmail_cache
+from notion_api import notion
+from notion_mirror import notion_db, page_title, page_text, page_number, page_select
 
 SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
 MAIL_CHANNEL_ID = 1351939144531574867
@@ -37,236 +33,260 @@ YBJ_ID = 877711777943650335  # 我的ID
 # 載入.env檔案
 dotenv.load_dotenv()
 LILTLEYBJ_KEY = os.getenv("LILTLEYBJ_KEY")
-NOTION_API_KEY = os.getenv("NOTION_API_KEY")
-NOTION_DATABASE_ID = os.getenv("NOTION_DATABASE_ID")
+MAIL_PUSH_ENABLED = os.getenv("MAIL_PUSH_ENABLED", "1") == "1"  # IMAP IDLE 即時通知新信
+MAIL_DIGEST_ENABLED = os.getenv("MAIL_DIGEST_ENABLED", "1") == "1"  # 在 mail_timer 的時間發送摘要
 
 # intents是要求機器人的權限
 intents = discord.Intents.all()
 bot = commands.Bot(command_prefix = "&", intents = intents)
 
-# 設定 Notion 資料庫
-db_url = f"https://api.notion.com/v1/databases/{NOTION_DATABASE_ID}/query"
-headers = {
-    "Authorization": f"Bearer {NOTION_API_KEY}",
-    "Content-Type": "application/json",
-    "Notion-Version": "2022-06-28"
-}
+REPEAT_LABELS = {"daily": "每天", "weekdays": "平日", "once": "一次"}
 
 @dataclass
 class Timer:
     content: str
     hour: int
     minute: int
+    owner: int = None  # 要提醒的使用者 ID（郵件鬧鐘沒有）
+    channel_id: int = TIMER_CHANNEL_ID  # 在哪個頻道提醒
+    repeat: str = "daily"  # daily（每天）/ weekdays（平日）/ once（一次）
+    page_id: str = None  # 對應的 Notion 頁面
 
 mail_timers = {
     "mail_timer1": Timer("mail_timer1", 8, 0), 
     "mail_timer2": Timer("mail_timer2", 20, 0)
 }
 
-personal_timers = {
-    "timer1": Timer("personal_timer1", 9, 0),
-    "timer2": Timer("personal_timer2", 13, 0)
-}
+# (owner, 鬧鐘名稱) -> Timer，每個人可以有同名的鬧鐘
+personal_timers = {}
+
+def valid_time(hour, minute):
+    return isinstance(hour, int) and isinstance(minute, int) and 0 <= hour < 24 and 0 <= minute < 60
+
+# 時間不合法（空白、超出範圍）的頁面回傳 None，不要讓一筆壞資料擋住其他鬧鐘
+def timer_from_page(page):
+    hour, minute = page_number(page, "hour"), page_number(page, "minute")
+    if not valid_time(hour, minute):
+        print(f"⚠️ 鬧鐘 `{page_title(page)}` 的時間 {hour}:{minute} 不合法，略過")
+        return None
+    owner = page_text(page, "owner")
+    channel_id = page_text(page, "channel")
+    return Timer(
+        page_title(page),
+        hour,
+        minute,
+        int(owner) if owner.isdigit() else YBJ_ID,  # 舊的鬧鐘沒有 owner，都是我的
+        int(channel_id) if channel_id.isdigit() else TIMER_CHANNEL_ID,
+        page_select(page, "repeat") or "daily",
+        page["id"]
+    )
+
+# 用 Notion 寫入後回傳的頁面新增或更新一個鬧鐘，並重新排程（O(log n)）
+def apply_timer_page(page):
+    timer = timer_from_page(page)
+    if timer is None:
+        return
+    old = next((key for key, t in personal_timers.items() if t.page_id == timer.page_id), None)
+    if old and old != (timer.owner, timer.content):
+        drop_timer(*old)  # 名稱被改掉了
+    personal_timers[(timer.owner, timer.content)] = timer
+    timer_scheduler.schedule(("personal", timer.owner, timer.content), timer)
+
+def drop_timer(owner, name):
+    personal_timers.pop((owner, name), None)
+    timer_scheduler.remove(("personal", owner, name))
+
+# 某個使用者的所有鬧鐘
+def timers_of(owner):
+    return {name: timer for (timer_owner, name), timer in personal_timers.items() if timer_owner == owner}
 
 async def set_timers():
-    mail_timers["mail_timer1"].hour = get_data("Name", "mail_timer1", "hour", "number")
-    mail_timers["mail_timer1"].minute = get_data("Name", "mail_timer1", "minute", "number")
-    mail_timers["mail_timer2"].hour = get_data("Name", "mail_timer2", "hour", "number")
-    mail_timers["mail_timer2"].minute = get_data("Name", "mail_timer2", "minute", "number")
-
-    query_data = {
-        "filter": {
-            "and": [
-                {
-                    "property": "Name",
-                    "title": {
-                        "does_not_contain": "mail_timer"
-                    }
-                },
-                {
-                    "property": "category",
-                    "select": {
-                        "equals": "timer"
-                    }
-                }
-            ]
-        }
-    }
-
-    response = requests.post(db_url, headers=headers, json=query_data)
-    if response.status_code == 200:
-        data = response.json()
-        personal_timers.clear()
-
-        for item in data["results"]:
-            name = item["properties"]["Name"]["title"][0]["text"]["content"]
-            hour = item["properties"]["hour"]["number"]
-            minute = item["properties"]["minute"]["number"]
-            personal_timers[name] = Timer(name, hour, minute)
+    pages = await notion_db.category("timer")  # Notion 還沒載入成功時在這裡就失敗，不會把錯誤訊息當成時間
+    mail_timers["mail_timer1"].hour = await get_data("Name", "mail_timer1", "hour", "number")
+    mail_timers["mail_timer1"].minute = await get_data("Name", "mail_timer1", "minute", "number")
+    mail_timers["mail_timer2"].hour = await get_data("Name", "mail_timer2", "hour", "number")
+    mail_timers["mail_timer2"].minute = await get_data("Name", "mail_timer2", "minute", "number")
+
+    personal_timers.clear()
+    for page in pages:
+        if "mail_timer" in page_title(page):
+            continue
+        timer = timer_from_page(page)
+        if timer is not None:
+            personal_timers[(timer.owner, timer.content)] = timer
+    sync_timer_schedule()
+
+# owner 為 None 時是郵件鬧鐘
+async def update_db_timer(timer_name, hour, minute, owner=None):
+    if owner is None:
+        page_id = await get_data("Name", timer_name, "id", "id")  # 取得 Notion 頁面 ID
     else:
-        print(f"❌ 無法從 Notion 獲取資料，錯誤碼：{response.status_code}")
+        timer = personal_timers.get((owner, timer_name))
+        page_id = timer.page_id if timer else None
 
-async def update_db_timer(timer_name, hour, minute):
-    page_id = get_data("Name", timer_name, "id", "id")  # 取得 Notion 頁面 ID
-    
     if not isinstance(page_id, str):  # 確保 page_id 有效
         return f"❌ 無法找到定時器 `{timer_name}`，請檢查名稱！"
 
-    url = f"https://api.notion.com/v1/pages/{page_id}"
-    data = {
-        "properties": {
-            "hour": {"number": hour},
-            "minute": {"number": minute}
-        }
-    }
-
-    async with aiohttp.ClientSession() as session:
-        async with session.patch(url, headers=headers, json=data) as response:
-            if response.status == 200:
-                return f"✅ `{timer_name}` 更新成功為 {hour}:{minute}！"
-            else:
-                return f"❌ `{timer_name}` 更新失敗，錯誤碼：{response.status}"
-
-async def add_db_personal_timer(timer_name, hour, minute):
-    url = "https://api.notion.com/v1/pages"
-    data = {
-        "parent": {"database_id": NOTION_DATABASE_ID},
-        "properties": {
-            "Name": {"title": [{"text": {"content": timer_name}}]},
-            "category": {"select": {"name": "timer"}},
-            "hour": {"number": hour},
-            "minute": {"number": minute}
-        }
-    }
-
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, headers=headers, json=data) as response:
-            if response.status == 200:
-                return f"✅ `{timer_name}` 已成功新增至資料庫！"
-            else:
-                return f"❌ 新增失敗，錯誤碼：{response.status}，錯誤訊息：{await response.text()}"
-
-async def delete_db_timer(timer_names):
-    timers_to_delete = []
-    for timer_name in timer_names:
-        page_id = get_data("Name", timer_name, "id", "id")
-        if isinstance(page_id, str):
-            timers_to_delete.append(page_id)
-    for page_id in timers_to_delete:
-        delete_url = f"https://api.notion.com/v1/pages/{page_id}"
-        delete_response = requests.patch(delete_url, headers=headers, json={"archived": True})
-
-        if delete_response.status_code == 200:
-            print(f"✅ 成功刪除計時器: {page_id}")
+    status, data = await notion_db.update(page_id, {
+        "hour": {"number": hour},
+        "minute": {"number": minute}
+    })
+    if status == 200:
+        # 直接用這次寫入的結果更新記憶體和排程，不用重新載入全部鬧鐘
+        if owner is None:
+            timer = mail_timers[timer_name]
+            timer.hour, timer.minute = hour, minute
+            timer_scheduler.schedule(("mail", timer_name), timer)
         else:
-            print(f"❌ 刪除失敗: {delete_response.text}")
-
-async def update_db_mail(mail_name, content):
-    page_id = get_data("Name", mail_name, "id", "id")
-    if not isinstance(page_id, str):
-        return "❌ 無法找到郵件記錄，請檢查名稱！"
-    url = f"https://api.notion.com/v1/pages/{page_id}"
-    data = {
-        "properties": {
-            "content": {"rich_text": [{"text": {"content": content}}]}
-        }
-    }
-
-    async with aiohttp.ClientSession() as session:
-        async with session.patch(url, headers=headers, json=data) as response:
-            if response.status == 200:
-                return "✅ 郵件記錄更新成功！"
-            else:
-                return f"❌ 郵件記錄更新失敗，錯誤碼：{response.status}"
+            apply_timer_page(data)
+        return f"✅ `{timer_name}` 更新成功為 {hour:02d}:{minute:02d}！"
+    else:
+        return f"❌ `{timer_name}` 更新失敗，錯誤碼：{status}"
+
+async def add_db_personal_timer(timer_name, hour, minute, owner, channel_id, repeat="daily"):
+    # Discord ID 超過 Notion number 的精度，用文字存
+    status, data = await notion_db.create({
+        "Name": {"title": [{"text": {"content": timer_name}}]},
+        "category": {"select": {"name": "timer"}},
+        "hour": {"number": hour},
+        "minute": {"number": minute},
+        "owner": {"rich_text": [{"text": {"content": str(owner)}}]},
+        "channel": {"rich_text": [{"text": {"content": str(channel_id)}}]},
+        "repeat": {"select": {"name": repeat}}
+    })
+    if status == 200:
+        apply_timer_page(data)
+        return f"✅ `{timer_name}` 已成功新增至資料庫！"
+    else:
+        return f"❌ 新增失敗，錯誤碼：{status}，錯誤訊息：{data}"
+
+async def delete_db_timer(owner, timer_names):
+    timers = timers_of(owner)
+    items = [(name, timers[name].page_id) for name in timer_names if name in timers]
+    results = await notion_db.archive_pages(items)
+    results += [(name, False, "查無資料") for name in timer_names if name not in timers]
+    for name, ok, _ in results:
+        if ok:
+            drop_timer(owner, name)
+    for name, ok, detail in results:
+        if ok:
+            print(f"✅ 成功刪除計時器: {name}")
+        else:
+            print(f"❌ 刪除失敗: {name}，{detail}")
+    return results
+
+# 把批次刪除的結果整理成一則回覆
+def format_delete_results(results):
+    response = ""
+    for name, ok, detail in results:
+        if ok:
+            response += f"✅ `{name}` 已成功刪除！\n"
+        else:
+            response += f"❌ `{name}` 刪除失敗（{detail}）\n"
+    return response
 
 async def add_idea_to_db(content):
     title = content[:40]
-    data = {
-        "parent": {"database_id": NOTION_DATABASE_ID},
-        "properties": {
-            "Name": {
-                "title": [{
-                    "text": {"content": title}
-                }]
-            },
-            "category": {
-                "select": {"name": "idea"}
-            },
-            "content": {
-                "rich_text": [{
-                    "text": {"content": content}
-                }]
-            }
+    status, data = await notion_db.create({
+        "Name": {
+            "title": [{
+                "text": {"content": title}
+            }]
+        },
+        "category": {
+            "select": {"name": "idea"}
+        },
+        "content": {
+            "rich_text": [{
+                "text": {"content": content}
+            }]
         }
-    }
-    response = requests.post("https://api.notion.com/v1/pages", headers=headers, json=data)
-    print("📥 Notion 回應狀態碼：", response.status_code)
-
+    })
+    print("📥 Notion 回應狀態碼：", status)
+    if status == 200:
+        idea_index.add_page(data)
+
+# 記錄一個啟動階段花了多久
+async def timed_phase(timings, name, coro):
+    start = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        timings[name] = time.perf_counter() - start
+
+# 啟動流程：在 bot 自己的 event loop 裡跑，和連上 Discord gateway 同時進行
 async def init():
-    await set_timers()
-    response = requests.post(db_url, headers=headers)
-    if response.status_code == 200:
-        print("讀取資料庫成功")
-    else:
-        print("讀取失敗")
-
-# 取得 Notion 資料庫中的資料
-def get_data(property="Name", name="None", req="content", type="rich_text"):
-    # 查詢條件：篩選出 "property" 為 "name" 的資料
-    query_data = {
-        "filter": {
-            "property": property,
-            "title": {
-                "equals": name
-            }
-        }
-    }
-
-    response = requests.post(db_url, headers=headers, json=query_data)
-    if response.status_code == 200:
-        data = response.json()
-        if data["results"]:
-            if type == "rich_text":
-                return data["results"][0]["properties"][req]["rich_text"][0]["text"]["content"]
-            elif type == "number":
-                return data["results"][0]["properties"][req]["number"]
-            elif type == "id":
-                return data["results"][0]["id"]
-        else:
-            return "查無資料"
-    else:
+    global mail_watch_task, notion_refresh_task, check_timer_task, archive_task
+    print("正在初始化...")
+    loop_monitor.start()  # 有同步呼叫卡住 event loop 時印出 stack
+    start = time.perf_counter()
+    timings = {}
+    idea_index.load()  # 先用上次存的索引，Notion 載入完成前也能列出靈感
+
+    # Notion 資料庫載入本機鏡像、Gmail 連線和信件快取同時進行
+    results = await asyncio.gather(
+        timed_phase(timings, "Notion 資料庫", notion_db.ensure_loaded()),
+        timed_phase(timings, "Gmail 連線", gmail_warm_up()),
+        timed_phase(timings, "Slash 指令", bot.tree.sync()),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"讀取失敗：{result!r}")
+    # Notion 載入失敗時只記錄下來，背景工作照樣啟動；鏡像的背景同步會重新載入，之後再透過 listeners 設定鬧鐘
+    try:
+        await timed_phase(timings, "鬧鐘", set_timers())
+    except Exception as e:
+        print(f"讀取鬧鐘失敗：{e!r}")
+    await sync_idea_index()
+    await timed_phase(timings, "Discord 連線", bot.wait_until_ready())  # 等頻道和成員都載入完成
+
+    # 背景對帳：鏡像同步到直接在 Notion 上做的修改後，重新比對鬧鐘（只有變動的會重新排程）
+    notion_db.listeners.append(set_timers)
+    notion_db.listeners.append(sync_idea_index)
+    notion_refresh_task = asyncio.create_task(notion_db.run_refresh_loop())
+    if MAIL_PUSH_ENABLED:
+        mail_watch_task = asyncio.create_task(watch_mail())
+    check_timer_task = asyncio.create_task(timer_scheduler.run())
+    archive_task = asyncio.create_task(backfill_archive())  # 舊信慢慢收進全文索引，收完之前查詢會改用 IMAP 搜尋
+
+    breakdown = "、".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items())
+    print(f"初始化完成，共 {time.perf_counter() - start:.2f}s（{breakdown}）")
+
+# 取得 Notion 資料庫中的資料（從本機鏡像查表）
+async def get_data(property="Name", name="None", req="content", type="rich_text"):
+    try:
+        page = await notion_db.get(name)
+    except Exception:
         return "資造庫讀取失敗"
+    if page is None:
+        return "查無資料"
+    if type == "rich_text":
+        return page_text(page, req)
+    elif type == "number":
+        return page_number(page, req)
+    elif type == "id":
+        return page["id"]
     
+# 靈感都從本機索引讀取，不用等 Notion
 def get_all_ideas():
-    query_data = {
-        "filter": {
-            "property": "category",
-            "select": {
-                "equals": "idea"
-            }
-        }
-    }
-
-    response = requests.post(db_url, headers=headers, json=query_data)
-    if response.status_code == 200:
-        data = response.json()
-        ideas = []
-        for item in data["results"]:
-            title = item["properties"]["Name"]["title"][0]["text"]["content"]
-            content = item["properties"]["content"]["rich_text"][0]["text"]["content"]
-            ideas.append([title, content])
-        return ideas
-    else:
-        print(f"❌ 無法從 Notion 獲取資料，錯誤碼：{response.status_code}")
-        return []
+    return idea_index.items()
+
+# 用 Notion 鏡像對帳，補上直接在 Notion 上新增或刪除的靈感
+async def sync_idea_index():
+    try:
+        idea_index.rebuild(await notion_db.category("idea"))
+    except Exception as e:
+        print(f"❌ 無法從 Notion 獲取資料：{e}")
 
 class TimeInputModal(Modal, title="設定鬧鐘時間"):
     hour = TextInput(label="小時 (0-23)", placeholder="請輸入 0-23", required=True)
     minute = TextInput(label="分鐘 (0-59)", placeholder="請輸入 0-59", required=True)
 
-    def __init__(self, timer_name):
+    def __init__(self, timer_name, owner=None):
         super().__init__()
         self.timer_name = timer_name  # 記住是哪個鬧鐘
+        self.owner = owner  # 郵件鬧鐘是 None
 
     async def on_submit(self, interaction: discord.Interaction):
         try:
@@ -274,319 +294,419 @@ class TimeInputModal(Modal, title="設定鬧鐘時間"):
             minute = int(self.minute.value)
             if 0 <= hour < 24 and 0 <= minute < 60:
                 await interaction.response.defer()  # 先回應，避免等待時間過長 
-                await update_db_timer(self.timer_name, hour, minute)
-                await set_timers()
-                await interaction.followup.send(f"✅ `{self.timer_name}` 更新為 {hour:02d}:{minute:02d}！", ephemeral=True)
+                result = await update_db_timer(self.timer_name, hour, minute, self.owner)
+                await interaction.followup.send(result, ephemeral=True)
             else:
-                await interaction.followup.send("❌ 時間輸入錯誤，請重新設定！", ephemeral=True)
+                await interaction.response.send_message("❌ 時間輸入錯誤，請重新設定！", ephemeral=True)
         except ValueError:
-            await interaction.followup.send("❌ 輸入格式錯誤，請輸入數字！", ephemeral=True)
+            await interaction.response.send_message("❌ 輸入格式錯誤，請輸入數字！", ephemeral=True)
 
 class AddTimerModal(Modal, title="新增鬧鐘"):
     timer_name = TextInput(label="請輸入鬧鐘名稱", placeholder="例如：吃藥", required=True)
     hour = TextInput(label="小時 (0-23)", placeholder="請輸入 0-23", required=True)
     minute = TextInput(label="分鐘 (0-59)", placeholder="請輸入 0-59", required=True)
+    repeat = TextInput(label="重複 (每天 / 平日 / 一次)", default="每天", required=False)
 
     async def on_submit(self, interaction: discord.Interaction):
         new_timer_name = self.timer_name.value.strip()
-        hour = int(self.hour.value)
-        minute = int(self.minute.value)
+        try:
+            hour = int(self.hour.value)
+            minute = int(self.minute.value)
+        except ValueError:
+            await interaction.response.send_message("❌ 輸入格式錯誤，請輸入數字！", ephemeral=True)
+            return
+        if not valid_time(hour, minute):
+            await interaction.response.send_message("❌ 時間輸入錯誤，請重新設定！", ephemeral=True)
+            return
+        repeats = {label: repeat for repeat, label in REPEAT_LABELS.items()}
+        repeat = repeats.get(self.repeat.value.strip() or "每天", self.repeat.value.strip())
+        if repeat not in REPEAT_LABELS:
+            await interaction.response.send_message("❌ 重複方式只能是 每天 / 平日 / 一次！", ephemeral=True)
+            return
         if new_timer_name:
             await interaction.response.defer()
-            for timer in mail_timers.keys() | personal_timers.keys():
-                if new_timer_name == timer:
-                    await interaction.followup.send("❌ 鬧鐘名稱重複，請重新輸入！", ephemeral=True)
-                    return
-
-            await add_db_personal_timer(new_timer_name, hour, minute)
-            await set_timers()
+            owner = interaction.user.id
+            if new_timer_name in mail_timers or (owner, new_timer_name) in personal_timers:
+                await interaction.followup.send("❌ 鬧鐘名稱重複，請重新輸入！", ephemeral=True)
+                return
 
-            await interaction.followup.send(f"✅ 新增 `{new_timer_name}` 成功！", ephemeral=True)
+            result = await add_db_personal_timer(new_timer_name, hour, minute, owner, interaction.channel_id, repeat)
+            await interaction.followup.send(result, ephemeral=True)
         else:
             await interaction.followup.send("❌ 鬧鐘名稱不能為空！", ephemeral=True)
 
-# 🔵 讓使用者選擇 Timer 的選單
+# 🔵 讓使用者選擇 Timer 的選單（只列出自己的鬧鐘）
 class TimerSelectView(View):
-    def __init__(self):
+    def __init__(self, owner):
         super().__init__()
-        self.add_item(TimerSelect())
+        self.add_item(TimerSelect(owner))
 
 class TimerSelect(Select):
-    def __init__(self):
-        options = [discord.SelectOption(label=key, value=key) for key in list(mail_timers.keys()) + list(personal_timers.keys())]
+    def __init__(self, owner):
+        self.owner = owner
+        options = [discord.SelectOption(label=key, value=f"mail:{key}") for key in mail_timers.keys()]
+        options += [discord.SelectOption(label=key, value=f"personal:{key}") for key in timers_of(owner).keys()]
         options.insert(0, discord.SelectOption(label="➕ 新增鬧鐘", value="add_new"))
-        super().__init__(placeholder="選擇要修改的鬧鐘", options=options)
+        super().__init__(placeholder="選擇要修改的鬧鐘", options=options[:25])  # Discord 選單最多 25 個選項
 
     async def callback(self, interaction: discord.Interaction):
-        if interaction.data["values"][0] == "add_new":
+        if interaction.user.id != self.owner:
+            await interaction.response.send_message("❌ 這不是你的鬧鐘選單！", ephemeral=True)
+            return
+        value = interaction.data["values"][0]
+        if value == "add_new":
             await interaction.response.send_modal(AddTimerModal())  # 顯示新增鬧鐘的輸入框
         else:
-            await interaction.response.send_modal(TimeInputModal(self.values[0]))  # 顯示輸入框
+            kind, name = value.split(":", 1)
+            await interaction.response.send_modal(TimeInputModal(name, self.owner if kind == "personal" else None))  # 顯示輸入框
 
 class TimerDeleteView(View):
-    def __init__(self):
+    def __init__(self, owner):
         super().__init__()
-        self.add_item(TimerDelete())
+        self.add_item(TimerDelete(owner))
 
 class TimerDelete(Select):
-    def __init__(self):
-        options = [discord.SelectOption(label=key, value=key) for key in list(mail_timers.keys()) + list(personal_timers.keys())]
+    def __init__(self, owner):
+        self.owner = owner
+        options = [discord.SelectOption(label=key, value=key) for key in timers_of(owner).keys()][:25]
         super().__init__(placeholder="選擇要刪除的鬧鐘", options=options, min_values=1, max_values=len(options))
 
     async def callback(self, interaction: discord.Interaction):
-        for value in interaction.data["values"]:
-            if value in mail_timers:
-                await interaction.response.send_message("❌ 不能刪除預設的郵件鬧鐘！", ephemeral=True)
-                return
-        
+        if interaction.user.id != self.owner:
+            await interaction.response.send_message("❌ 這不是你的鬧鐘選單！", ephemeral=True)
+            return
+
         await interaction.response.defer()
-        await delete_db_timer(interaction.data["values"])
-        await interaction.followup.send(f"✅ `{value}` 已成功刪除！", ephemeral=True)
-        await set_timers()
+        results = await delete_db_timer(self.owner, interaction.data["values"])
+        await interaction.followup.send(format_delete_results(results), ephemeral=True)
 
 class IdeaDeleteView(View):
-    def __init__(self):
+    def __init__(self, ideas):
         super().__init__()
-        self.add_item(IdeaDelete())
+        self.add_item(IdeaDelete(ideas))
 
 class IdeaDelete(Select):
-    def __init__(self):
-        ideas = get_all_ideas()
-        options = [discord.SelectOption(label=title, value=title) for title, _ in ideas]
+    def __init__(self, ideas):
+        ideas = ideas[-25:]  # 下拉選單最多 25 個選項，列出最新的
+        self.titles = {page_id: title for page_id, title, _ in ideas}
+        options = [discord.SelectOption(label=title, value=page_id) for page_id, title, _ in ideas]
         super().__init__(placeholder="選擇要刪除的靈感", options=options, min_values=1, max_values=len(options))
 
     async def callback(self, interaction: discord.Interaction):
         await interaction.response.defer()
-        for value in interaction.data["values"]:
-            page_id = get_data("Name", value, "id", "id")
-            if isinstance(page_id, str):
-                delete_url = f"https://api.notion.com/v1/pages/{page_id}"
-                delete_response = requests.patch(delete_url, headers=headers, json={"archived": True})
-                if delete_response.status_code == 200:
-                    print(f"✅ 成功刪除靈感: {value}")
-                else:
-                    print(f"❌ 刪除失敗: {delete_response.text}")
-        await interaction.followup.send("✅ 已成功刪除靈感！", ephemeral=True)
+        # 索引裡已經有頁面 ID，直接封存，不用再查名稱
+        page_ids = interaction.data["values"]
+        results = await notion_db.archive_pages([(self.titles[page_id], page_id) for page_id in page_ids])
+        idea_index.remove([page_id for page_id, (_, ok, _) in zip(page_ids, results) if ok])
+        for name, ok, detail in results:
+            if ok:
+                print(f"✅ 成功刪除靈感: {name}")
+            else:
+                print(f"❌ 刪除失敗: {name}，{detail}")
+        await interaction.followup.send(format_delete_results(results), ephemeral=True)
+
+# Render 的健康檢查：Discord 連線和鬧鐘排程器是必要的，Gmail / Notion 只回報最後一次成功的時間
+health = HealthServer()
+
+def ago(timestamp):
+    return f"{time.time() - timestamp:.0f} 秒前" if timestamp else "尚無紀錄"
+
+def last_call_status(last_success, last_error):
+    ok = last_error is None or (last_success is not None and last_success > last_error)
+    return ok, f"上次成功：{ago(last_success)}，上次失敗：{ago(last_error)}"
+
+@health.check("discord_gateway")
+def gateway_check():
+    connected = bot.is_ready() and not bot.is_closed() and not math.isnan(bot.latency)
+    return connected, f"延遲 {bot.latency * 1000:.0f} ms" if connected else "未連線"
+
+@health.check("timer_loop")
+def timer_check():
+    running = check_timer_task is not None and not check_timer_task.done()
+    deadline = timer_scheduler.next_deadline()
+    if not running:
+        return False, "未執行"
+    return True, f"下一個鬧鐘 {deadline:%m-%d %H:%M}" if deadline else "執行中（沒有鬧鐘）"
+
+@health.check("imap", critical=False)
+def imap_check():
+    return last_call_status(gmail_pool.last_success, gmail_pool.last_error)
+
+@health.check("notion", critical=False)
+def notion_check():
+    ok, detail = last_call_status(notion.last_success, notion.last_error)
+    stats = notion.limiter.stats()
+    return ok, (f"{detail}，排隊中 {stats['queue_depth']} 個，平均等待 {stats['avg_wait']:.2f} 秒，"
+                f"最長 {stats['max_wait']:.2f} 秒，429 共 {stats['throttled']} 次")
+
+@bot.event
+async def setup_hook():
+    global startup_task
+    await health.start()
+    startup_task = asyncio.create_task(init())
 
 @bot.event
 async def on_ready():
     print(f"目前登入身份 --> {bot.user}")
     channel = bot.get_channel(SYSTEM_CHANNEL_ID)
-    await channel.send("LittleYBJ 已啟動！")
-    time.sleep(10)  # 等待 10 秒，讓所有頻道和成員都載入完成
-    if not check_timer_task.is_running():  # 確保 task 只會啟動一次
-        check_timer_task.start()
-        return
+    if channel:
+        await channel.send("LittleYBJ 已啟動！")
+
+startup_task = None
+mail_watch_task = None
+notion_refresh_task = None
+archive_task = None
 
-user_commands = ["help", "哈囉", "嗨", "信", "課程信件", "設定鬧鐘", "刪除鬧鐘", "鬧鐘", "靈感", "idea", "刪除靈感", "test"]
+router = CommandRouter()
 
 @bot.event
 async def on_message(message):
     if message.author == bot.user:  # 避免機器人回應自己
         return
 
-    if message.channel.id == IDEA_CHANNEL_ID and message.content not in user_commands:  
-        # 發訊息詢問是否加入 Notion
-        prompt = await message.channel.send("你要不要新增到靈感？")
-        await prompt.add_reaction("✅")
-        await prompt.add_reaction("❌")
+    # 指令只看訊息開頭，一般聊天提到「信」或「鬧鐘」不會觸發查詢
+    if not await router.dispatch(message) and message.channel.id == IDEA_CHANNEL_ID:
+        await ask_add_idea(message)
 
-        def check(reaction, user):
-            return (
-                user == message.author and
-                reaction.message.id == prompt.id and
-                str(reaction.emoji) in ["✅", "❌"]
-            )
+    await bot.process_commands(message)  # 確保指令仍然可用
 
-        try:
-            reaction, user = await bot.wait_for("reaction_add", timeout=30.0, check=check)
-            if str(reaction.emoji) == "✅":
-                ideas = get_all_ideas()
-                for title, content in ideas:
-                    if title == message.content:
-                        await message.channel.send("❌ 此靈感已存在！")
-                        await prompt.delete()
-                        return
-                await add_idea_to_db(message.content)
-                await message.channel.send("✅ 已加入靈感")
-                await prompt.delete()  # 刪除提示訊息
-            else:
+async def ask_add_idea(message):
+    # 發訊息詢問是否加入 Notion
+    prompt = await message.channel.send("你要不要新增到靈感？")
+    await prompt.add_reaction("✅")
+    await prompt.add_reaction("❌")
+
+    def check(reaction, user):
+        return (
+            user == message.author and
+            reaction.message.id == prompt.id and
+            str(reaction.emoji) in ["✅", "❌"]
+        )
+
+    try:
+        reaction, user = await bot.wait_for("reaction_add", timeout=30.0, check=check)
+        if str(reaction.emoji) == "✅":
+            if idea_index.find_duplicate(message.content):
+                await message.channel.send("❌ 此靈感已存在！")
                 await prompt.delete()
-
-        except:
-            await prompt.delete()
-        return
-    if "help" in message.content or "Help" in message.content:  # 偵測關鍵字「help」
-        await message.channel.send("哈囉！我是 LittleYBJ，你的小幫手！以下是我能幫助你的指令：\n"
-                                   "## <指令列表>\n"
-                                   "1. **help** / **Help** - 顯示指令列表\n"
-                                   "2. **哈囉** / **嗨** - 打招呼\n"
-                                   "3. **信 <關鍵字>** - 查詢郵件 (預設會在 8:00 和 20:00 自動查詢最新信件，可從「**設定鬧鐘**」調整)\n"
-                                   "4. **課程信件** - 查詢近期課程相關郵件\n"
-                                   "5. **鬧鐘** - 顯示目前運行中的所有鬧鐘，我會在設定的時間提醒你！ (mail_timer不會提醒！但會在該時間查詢信件)\n"
-                                   "6. **設定鬧鐘** - 設定、新增鬧鐘\n"
-                                   "7. **刪除鬧鐘** - 刪除鬧鐘\n"
-                                   "8. **靈感** / **idea** - 顯示靈感列表\n"
-                                   "9. **刪除靈感** - 刪除指定靈感")
-    elif "哈囉" in message.content or "嗨" in message.content:
-        await message.channel.send("哈囉！我是 LittleYBJ，你的小幫手！有什麼可以幫助你的嗎？")
-    elif "課程信件" in message.content:
-        channel = bot.get_channel(MAIL_CHANNEL_ID)
-        await check_course_email(channel)
-    elif "信" in message.content:
-        channel = bot.get_channel(MAIL_CHANNEL_ID)
-        keywords = message.content.split()  # 取得使用者輸入的所有詞
-        
-        if len(keywords) > 1:
-            await check_email(channel, *keywords[1:])  # 正確傳遞 channel 參數
+                return
+            await add_idea_to_db(message.content)
+            await message.channel.send("✅ 已加入靈感")
+            await prompt.delete()  # 刪除提示訊息
         else:
-            await check_email(channel)  # 只輸入「信」時，執行無關鍵字的查詢
-    elif "設定鬧鐘" in message.content:
-        channel = bot.get_channel(TIMER_CHANNEL_ID)
-        await update_timer(channel)
-    elif "刪除鬧鐘" in message.content:
-        channel = bot.get_channel(TIMER_CHANNEL_ID)
-        await delete_timer(channel)
-    elif "鬧鐘" in message.content:
-        channel = bot.get_channel(TIMER_CHANNEL_ID)
-        response = "## <目前運行中的所有鬧鐘>\n"
-        timers = {**mail_timers, **personal_timers}
-        for timer in timers.keys():
-            response += f"🕰️ **{timer}**  時間：{timers[timer].hour:02d}:{timers[timer].minute:02d}\n"
-        await channel.send(response)
-    elif "刪除靈感" in message.content:
-        channel = bot.get_channel(IDEA_CHANNEL_ID)
-        await delete_idea(channel)
-    elif "靈感" in message.content or "idea" in message.content:
-        channel = bot.get_channel(IDEA_CHANNEL_ID)
-        ideas = get_all_ideas()
-        if not ideas:
-            response = "目前沒有收錄任何靈感！"
-        else:    
-            response = "## <靈感列表>\n"
-        for title, content in ideas:
-            response += f"💡 **{title}**"
-            if len(content) > 40:
-                response += "..."
-            response += f"\n"
-        await channel.send(response)
-    elif "test" in message.content:
-        print("test")
+            await prompt.delete()
 
-    await bot.process_commands(message)  # 確保指令仍然可用
+    except:
+        await prompt.delete()
+
+@router.command("help", priority=1, slash="help", description="顯示指令列表")
+async def help_command(inv):
+    await inv.reply("哈囉！我是 LittleYBJ，你的小幫手！以下是我能幫助你的指令：\n"
+                    "## <指令列表>\n"
+                    "1. **help** / **Help** - 顯示指令列表\n"
+                    "2. **哈囉** / **嗨** - 打招呼\n"
+                    "3. **信 <關鍵字>** - 查詢郵件 (預設會在 8:00 和 20:00 自動查詢最新信件，可從「**設定鬧鐘**」調整)\n"
+                    "4. **課程信件** - 查詢近期課程相關郵件\n"
+                    "5. **鬧鐘** - 顯示目前運行中的所有鬧鐘，我會在設定的時間提醒你！ (mail_timer不會提醒！但會在該時間查詢信件)\n"
+                    "6. **設定鬧鐘** - 設定、新增鬧鐘\n"
+                    "7. **刪除鬧鐘** - 刪除鬧鐘\n"
+                    "8. **靈感** / **idea** - 顯示靈感列表\n"
+                    "9. **刪除靈感** - 刪除指定靈感\n"
+                    "以上指令也都有對應的 slash command（輸入 / 就會列出）")
+
+@router.command("哈囉", "嗨", priority=-1, boundary=False, slash="hello", description="打招呼")  # 「哈囉你好」也算
+async def hello_command(inv):
+    await inv.reply("哈囉！我是 LittleYBJ，你的小幫手！有什麼可以幫助你的嗎？")
+
+@router.command("課程信件", slash="course_mail", description="查詢近期課程相關郵件")
+async def course_mail_command(inv):
+    await check_course_email(bot.get_channel(MAIL_CHANNEL_ID))
+
+@router.command("信", slash="mail", description="查詢郵件，後面可以加上關鍵字（用空白分隔）")
+async def mail_command(inv):
+    # 只輸入「信」時，執行無關鍵字的查詢
+    await check_email(bot.get_channel(MAIL_CHANNEL_ID), *inv.args)
+
+@router.command("設定鬧鐘", slash="set_timer", description="設定、新增鬧鐘")
+async def set_timer_command(inv):
+    await update_timer(bot.get_channel(TIMER_CHANNEL_ID), inv.author_id)
+
+@router.command("刪除鬧鐘", slash="delete_timer", description="刪除鬧鐘")
+async def delete_timer_command(inv):
+    await delete_timer(bot.get_channel(TIMER_CHANNEL_ID), inv.author_id)
+
+@router.command("鬧鐘", slash="timers", description="顯示目前運行中的所有鬧鐘")
+async def timers_command(inv):
+    channel = bot.get_channel(TIMER_CHANNEL_ID)
+    lines = [f"🕰️ **{name}**  時間：{timer.hour:02d}:{timer.minute:02d}\n" for name, timer in mail_timers.items()]
+    lines += [f"🕰️ **{name}**  時間：{timer.hour:02d}:{timer.minute:02d}（{REPEAT_LABELS.get(timer.repeat, timer.repeat)}）\n"
+              for name, timer in timers_of(inv.author_id).items()]
+    await outbox.send_lines(channel, lines, "## <目前運行中的所有鬧鐘>\n")
+
+@router.command("刪除靈感", slash="delete_idea", description="刪除指定靈感")
+async def delete_idea_command(inv):
+    await delete_idea(bot.get_channel(IDEA_CHANNEL_ID))
+
+@router.command("靈感", "idea", slash="ideas", description="顯示靈感列表")
+async def ideas_command(inv):
+    channel = bot.get_channel(IDEA_CHANNEL_ID)
+    ideas = get_all_ideas()
+    if not ideas:
+        await outbox.send(channel, "目前沒有收錄任何靈感！")
+    else:
+        lines = [f"💡 **{title}**{'...' if len(content) > 40 else ''}\n" for _, title, content in ideas]
+        await outbox.send_lines(channel, lines, "## <靈感列表>\n")
+
+@router.command("test")
+async def test_command(inv):
+    print("test")
+
+router.register_slash(bot.tree)
 
 @bot.command()
 async def list_users(ctx):
     guild = ctx.guild
     members = guild.members  # 取得所有成員
-    response = "**伺服器內的成員 ID 列表：**\n"
-    for member in members:
-        if not member.bot:
-            response += f"👤 `{member.name}` - `{member.id}`\n"
-    await ctx.send(response)
+    lines = [f"👤 `{member.name}` - `{member.id}`\n" for member in members if not member.bot]
+    await outbox.send_lines(ctx.channel, lines, "**伺服器內的成員 ID 列表：**\n")
+
+@bot.command()
+async def loop_stats(ctx):
+    stats = loop_monitor.stats()
+    if not stats:
+        await outbox.send(ctx.channel, "✅ event loop 目前沒有卡住的紀錄")
+        return
+    lines = [f"🐢 `{site}` - {count} 次，共 {total:.2f} 秒，最長 {longest:.2f} 秒\n" for site, count, total, longest in stats]
+    await outbox.send_lines(ctx.channel, lines, "**event loop 卡住最久的位置：**\n")
+
+@bot.command()
+async def backfill(ctx):
+    """顯示整個信箱收進全文索引的進度，上次沒收完而且背景工作已經停了就重新開始"""
+    global archive_task
+    state = mail_backfill.progress
+    if state["running"]:
+        rate = state["messages"] / max(time.time() - state["started"], 1e-9)
+        lines = [f"📚 收錄中：{state['chunks']}/{state['total_chunks']} 段，{state['messages']} 封（每秒 {rate:.0f} 封）\n"]
+        lines += [f"　{course}：{count} 封\n" for course, count in state["courses"].most_common()]
+        await outbox.send_lines(ctx.channel, lines)
+    elif gmail_cache().archive_complete():
+        await outbox.send(ctx.channel, "✅ 整個信箱都已收進全文索引")
+    elif archive_task is None or archive_task.done():
+        archive_task = asyncio.create_task(backfill_archive())
+        await outbox.send(ctx.channel, "📚 開始把整個信箱收進全文索引，中斷過的話會從沒做完的段落繼續")
+    else:
+        await outbox.send(ctx.channel, f"⏳ 上次還有 {state['total_chunks'] - state['chunks']} 段沒收完，稍後會自動重試")
 
 @bot.command()
 async def list_channels(ctx):
     guild = ctx.guild  # 取得伺服器
     channels = guild.channels  # 取得所有頻道
-    response = "**伺服器內的頻道 ID 列表：**\n"
-    for channel in channels:
-        response += f"📌 `{channel.name}` - `{channel.id}`\n"
-    await ctx.send(response)
+    lines = [f"📌 `{channel.name}` - `{channel.id}`\n" for channel in channels]
+    await outbox.send_lines(ctx.channel, lines, "**伺服器內的頻道 ID 列表：**\n")
 
 async def check_email(channel, *keywords):
-    global last_course_subject, last_school_subject
-    no_new_course_email = True
-    no_new_school_email = True
-    no_other_email = True
-
     if keywords:
-        for keyword in keywords:
-            emails = search_emails(keyword, 30)
+        # 多個關鍵字同時查詢，不會卡住 event loop
+        results = await asyncio.gather(*(search_emails(keyword, 30) for keyword in keywords))
+        MAIL_SCANNED.observe(sum(len(emails) for emails in results), mode="keyword")
+        sections = []
+        for keyword, emails in zip(keywords, results):
             if emails:
-                response = f"## <近30封符合 `{keyword}` 的郵件>\n"
-                for email in emails:
-                    response += f"📩 **寄件人：** {email['From']}\n📌 **主旨：** {email['Subject']}\n\n"
-                await channel.send(response)
+                lines = [f"📩 **寄件人：** {email['From']}\n📌 **主旨：** {email['Subject']}\n\n" for email in emails]
+                sections.append((f"## <最符合 `{keyword}` 的30封郵件>\n", lines))
             else:
-                await channel.send(f"🔍 找不到近30封符合 `{keyword}` 的郵件。")
+                sections.append((f"🔍 信箱中找不到符合 `{keyword}` 的郵件。", []))
+        await outbox.send_sections(channel, sections)
         return
 
-    # 課程郵件處理
-    emails = search_course_emails(30)
-    if emails:
-        response = f"## <課程郵件通知>\n"
-        for email in emails:
-            if email["Subject"] != last_course_subject:
-                if no_new_course_email:
-                    no_new_course_email = False
-                    last_course_subject = email["Subject"]
-                    await update_db_mail("last_course_subject", last_course_subject)
-                response += f"**📩 課程：**{email['Course']}\n**📌 主旨：**{email['Subject']}\n\n"
-            else:
-                break
-
-        if not no_new_course_email:
-            await channel.send(response)
-
-    # 學校郵件處理
-    emails = search_emails("陽明交通大學", 30)
-    if emails:
-        response = f"## <學校相關郵件通知>\n"
-        for email in emails:
-            if email["Subject"] != last_school_subject:
-                if no_new_school_email:
-                    no_new_school_email = False
-                    last_school_subject = email["Subject"]
-                    await update_db_mail("last_school_subject", last_school_subject)
-                response += f"**📩 寄件人：**{email['From']}\n**📌 主旨：**{email['Subject']}\n\n"
+    # 只抓上次摘要之後的新信（本機快取記錄看到哪一封，重新部署後從 Notion 存的位置接著報）
+    emails, mark = await peek_new_emails("digest", resume=await load_digest_mark())
+    MAIL_SCANNED.observe(len(emails), mode="digest")
+    sections = render_mail_sections(emails)
+    if sections:
+        sent = await outbox.send_sections(channel, sections)
+    else:
+        sent = await outbox.send(channel, "📭 目前沒有新郵件！")
+    # 送出成功才記下看到哪裡，Discord 發送失敗的話下次摘要會再報一次
+    if sent:
+        await advance_consumer("digest", mark)
+        await save_digest_mark(mark)
+
+# Render 重新部署時本機的信件快取會被清掉，摘要看到哪一封另外存在 Notion 頁面的 content（UIDVALIDITY:UID）
+DIGEST_MARK_PAGE = "last_mail_uid"
+
+async def load_digest_mark():
+    try:
+        uidvalidity, uid = map(int, (await get_data("Name", DIGEST_MARK_PAGE)).split(":"))
+    except (AttributeError, ValueError):  # 查無資料、讀取失敗或格式不對
+        return None
+    return uidvalidity, uid
+
+async def save_digest_mark(mark):
+    if mark is None:
+        return
+    content = f"{mark[0]}:{mark[1]}"
+    properties = {"content": {"rich_text": [{"text": {"content": content}}]}}
+    try:
+        page = await notion_db.get(DIGEST_MARK_PAGE)
+        if page is None:
+            status, data = await notion_db.create({"Name": {"title": [{"text": {"content": DIGEST_MARK_PAGE}}]}, **properties})
+        elif page_text(page, "content") != content:
+            status, data = await notion_db.update(page["id"], properties)
+        else:
+            return
+    except Exception as e:
+        print(f"⚠️ 無法儲存信件摘要位置：{e!r}")
+        return
+    if status != 200:
+        print(f"⚠️ 無法儲存信件摘要位置，錯誤碼：{status}")
+
+# 一次掃過新信，替每封信標上所有符合的規則，依段落整理成 [(標題, 多行紀錄)]
+def render_mail_sections(emails):
+    sections = {}
+    for email in reversed(emails):  # 從最新到舊
+        for tag, value in classifier.classify(email).items():
+            rule = classifier.rule(tag)
+            lines = sections.setdefault(rule.section, {})
+            if email["UID"] in lines:  # 同一封信符合同一段的多個規則時只列一次
+                continue
+            if rule.label:
+                lines[email["UID"]] = f"**📩 {rule.label}：**{value}\n**📌 主旨：**{email['Subject']}\n\n"
             else:
-                break
-
-        if not no_new_school_email:
-            await channel.send(response)
+                lines[email["UID"]] = f"**📩 寄件人：**{email['From']}\n**📌 主旨：**{email['Subject']}\n\n"
 
-    # 其他郵件處理
-    response = f"## <其他郵件通知>\n"
-    emails = search_emails("蝦皮", 30)
-    if emails:
-        no_other_email = False
-        no_new_email = False
-        for email in emails:
-            response += f"**📩 寄件人：**{email['From']}\n**📌 主旨：**{email['Subject']}\n\n"
-    emails = search_emails("物理", 30)
-    if emails:
-        no_other_email = False
-        no_new_email = False
-        for email in emails:
-            response += f"**📩 寄件人：**{email['From']}\n**📌 主旨：**{email['Subject']}\n\n"
-    if not no_other_email:
-        await channel.send(response)
+    return [(f"## <{section}>\n", list(lines.values())) for section, lines in sections.items()]
 
-    if no_new_email:
-        await channel.send("📭 目前沒有新郵件！")
+# IDLE 推播：有新信就馬上分類並發到郵件頻道
+async def watch_mail():
+    async for emails in watch_new_emails("push"):
+        channel = bot.get_channel(MAIL_CHANNEL_ID)
+        if not channel:
+            continue
+        await outbox.send_sections(channel, render_mail_sections(emails))
 
 async def check_course_email(channel):
-    emails = search_course_emails(40)
+    emails = await search_course_emails(40)
     if emails:
-        response = f"## <近期課程郵件通知>\n"
-        for email in emails:
-            response += f"**📚 課程：**{email['Course']}\n**📩 寄件人：**{email['From']}\n**📌 主旨：**{email['Subject']}\n\n"
-        await channel.send(response)
+        lines = [f"**📚 課程：**{email['Course']}\n**📩 寄件人：**{email['From']}\n**📌 主旨：**{email['Subject']}\n\n" for email in emails]
+        await outbox.send_lines(channel, lines, "## <近期課程郵件通知>\n")
     else:
-        await channel.send("🔍 近期無課程郵件。")
+        await outbox.send(channel, "🔍 近期無課程郵件。")
 
 @bot.command()
 async def update_timer_cmd(ctx):
-    view = TimerSelectView()
+    view = TimerSelectView(ctx.author.id)
     await ctx.send("請選擇要修改的鬧鐘", view=view)
 
-async def update_timer(channel):
-    view = TimerSelectView()
+async def update_timer(channel, owner):
+    view = TimerSelectView(owner)
     await channel.send("請選擇要設定的鬧鐘", view=view)
 
-async def delete_timer(channel):
-    view = TimerDeleteView()
+async def delete_timer(channel, owner):
+    if not timers_of(owner):
+        await channel.send("目前沒有鬧鐘可以刪除！")
+        return
+    view = TimerDeleteView(owner)
     await channel.send("請選擇要刪除的鬧鐘", view=view)
 
 async def delete_idea(channel):
@@ -594,37 +714,64 @@ async def delete_idea(channel):
     if not ideas:
         await channel.send("目前沒有靈感可以刪除！")
         return
-    view = IdeaDeleteView()
+    view = IdeaDeleteView(ideas)
     await channel.send("請選擇要刪除的靈感", view=view)
 
-@tasks.loop(minutes=1)  # 每分鐘檢查一次是否到達設定時間
-async def check_timer_task():
-    channel = bot.get_channel(SYSTEM_CHANNEL_ID)
-    now = datetime.datetime.now(ZoneInfo("Asia/Taipei"))  # 使用台北時間，避免Render所在時區不同
-    # await channel.send(f"目前時間：{now.hour}:{now.minute}")
+# 鬧鐘到期時呼叫，同一時間到期的鬧鐘會一起傳進來
+async def fire_timers(due):
+    # 同一個頻道的提醒合併成一則訊息；提及使用者只需要 ID，不用再向 Discord 查詢使用者
+    reminders = {}
+    finished = []
+    now = datetime.datetime.now(TAIPEI)
+    for key, timer, scheduled in due:
+        TIMER_SKEW_SECONDS.observe((now - scheduled).total_seconds())
+        if key[0] == "personal":
+            reminders.setdefault(timer.channel_id, []).append(f"⏰ 鬧鐘提醒 <@{timer.owner}>： **{timer.content}**！")
+            if timer.repeat == "once":
+                finished.append(timer)
+    # 各頻道的提醒同時排進送信佇列，和同一批的郵件摘要也能合併
+    await asyncio.gather(*(
+        outbox.send_lines(bot.get_channel(channel_id) or bot.get_channel(TIMER_CHANNEL_ID), [line + "\n" for line in lines])
+        for channel_id, lines in reminders.items()
+    ))
+
+    # 只響一次的鬧鐘響完就刪除
+    await finish_timers(finished)
+
+    # 檢查郵件（摘要模式）
+    if MAIL_DIGEST_ENABLED and any(key[0] == "mail" for key, _, _ in due):
+        channel = bot.get_channel(MAIL_CHANNEL_ID)
+        if channel:
+            await check_email(channel=channel)
 
-    # 檢查郵件
-    channel = bot.get_channel(MAIL_CHANNEL_ID)
-    for timer in mail_timers.values():
-        if now.hour == timer.hour and now.minute == timer.minute:
-            if channel:
-                await check_email(channel=channel)
+async def finish_timers(timers):
+    if not timers:
+        return
+    for timer in timers:
+        drop_timer(timer.owner, timer.content)
+    await notion_db.archive_pages([(timer.content, timer.page_id) for timer in timers])
+
+# 延遲太久被略過的單次鬧鐘也當成結束，不然對帳時又會被排到隔天
+async def expire_timers(expired):
+    await finish_timers([timer for key, timer, _ in expired if key[0] == "personal"])
+
+timer_scheduler = TimerScheduler(fire_timers, on_expire=expire_timers)
+check_timer_task = None
+
+# 讓排程器和 mail_timers / personal_timers 一致：只有新增、修改、刪除的鬧鐘會重新排程
+def sync_timer_schedule():
+    timers = {("mail", name): timer for name, timer in mail_timers.items()}
+    timers.update({("personal", owner, name): timer for (owner, name), timer in personal_timers.items()})
+    for key in list(timer_scheduler.keys()):
+        if key not in timers:
+            timer_scheduler.remove(key)
+    for key, timer in timers.items():
+        if valid_time(timer.hour, timer.minute):  # Notion 查不到時會是錯誤訊息字串
+            timer_scheduler.schedule(key, timer)
+        else:
+            timer_scheduler.remove(key)
+            print(f"⚠️ 鬧鐘 {key} 的時間 {timer.hour}:{timer.minute} 不合法，不排程")
 
-    # 檢查鬧鐘
-    channel = bot.get_channel(TIMER_CHANNEL_ID)
-    for timer in personal_timers.values():
-        if now.hour == timer.hour and now.minute == timer.minute:
-            YBJ = await bot.fetch_user(YBJ_ID)
-            await channel.send(f"⏰ 鬧鐘提醒 {YBJ.mention}： **{timer.content}**！")
-
-# 記錄上次讀取到的最新信件主旨
-last_course_subject = get_data("Name", "last_course_subject", "content", "rich_text")
-last_school_subject = get_data("Name", "last_school_subject", "content", "rich_text")
-
-print("正在初始化...")
-asyncio.run(init())
-print("初始化完成")
-
-print("延遲啟動，防止 rate limit...")
-time.sleep(10)
-bot.run(LILTLEYBJ_KEY)
\ No newline at end of file
+# 只有直接執行時才啟動 bot；benchmark 會 import 這個模組來呼叫裡面的函式
+if __name__ == "__main__":
+    bot.run(LILTLEYBJ_KEY)
\ No newline at end of file
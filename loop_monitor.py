@@ -0,0 +1,98 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from metrics import LOOP_LAG_SECONDS
+
+# event loop 卡住偵測：heartbeat 量每次 sleep 醒來的延遲，另一條 watchdog 執行緒發現 heartbeat 停太久時，
+# 直接抓 event loop 執行緒當下的 stack，找出是哪一行同步呼叫卡住了 Discord 連線
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "0.25"))  # 秒
+STACK_DEPTH = 8  # log 裡印出幾層 stack
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def call_site(stack):
+    """stack 中最內層、屬於這個專案的那一行（不含第三方套件），找不到就用最內層"""
+    for entry in reversed(stack):
+        if entry.filename.startswith(PROJECT_DIR) and "site-packages" not in entry.filename \
+                and entry.filename != __file__:
+            return f"{os.path.relpath(entry.filename, PROJECT_DIR)}:{entry.lineno} {entry.name}"
+    entry = stack[-1]
+    return f"{entry.filename}:{entry.lineno} {entry.name}"
+
+class LoopMonitor:
+    def __init__(self, interval=0.1, threshold=LOOP_LAG_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.loop = None
+        self.sites = {}  # 呼叫位置 -> [次數, 總共卡住秒數, 最長一次秒數]
+        self._beat = time.monotonic()  # heartbeat 最後一次執行的時間
+        self._blocked = None  # 偵測到卡住時：(最後 heartbeat 時間, 呼叫位置)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._task = None
+
+    def start(self):
+        """在 event loop 裡呼叫"""
+        self.loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = self.loop.create_task(self._heartbeat(), name="loop-monitor")
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            LOOP_LAG_SECONDS.observe(max(0.0, now - expected))
+            with self._lock:
+                self._beat = now
+                blocked, self._blocked = self._blocked, None
+            if blocked:
+                started, site = blocked
+                duration = now - started - self.interval
+                stats = self.sites.setdefault(site, [0, 0.0, 0.0])
+                stats[0] += 1
+                stats[1] += duration
+                stats[2] = max(stats[2], duration)
+                print(f"🐢 event loop 恢復，共卡住 {duration:.2f} 秒：{site}")
+
+    def _watch(self):
+        while not self._stop.wait(self.threshold / 2):
+            with self._lock:
+                lag = time.monotonic() - self._beat - self.interval
+                if self._blocked is not None or lag < self.threshold:
+                    continue
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is None:
+                    continue
+                stack = traceback.extract_stack(frame)
+                site = call_site(stack)
+                self._blocked = (self._beat, site)
+            print(f"🐢 event loop 已經卡住 {lag:.2f} 秒（{self._task_name()}）：{site}\n"
+                  + "".join(traceback.format_list(stack[-STACK_DEPTH:])), end="")
+
+    def _task_name(self):
+        try:
+            task = asyncio.current_task(self.loop)  # 從其他執行緒讀，只用來顯示
+        except Exception:
+            task = None
+        if task is None:
+            return "callback"
+        coro = task.get_coro()
+        return f"task {task.get_name()} / {getattr(coro, '__qualname__', coro)}"
+
+    def stats(self, limit=10):
+        """卡住總時間最長的呼叫位置：[(位置, 次數, 總秒數, 最長秒數)]"""
+        ranked = sorted(self.sites.items(), key=lambda item: item[1][1], reverse=True)
+        return [(site, count, total, longest) for site, (count, total, longest) in ranked[:limit]]
+
+loop_monitor = LoopMonitor()
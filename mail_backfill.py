@@ -0,0 +1,137 @@
+import argparse
+import imaplib
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, Queue
+import gmail_api
+
+# 整個信箱的批次收錄：把比同步基準更舊的信依 UID 切成固定範圍的段落，用多條獨立的 IMAP 連線同時抓取，
+# 解碼標頭和內文後收進全文索引。每段完成就記在快取裡，中斷（重開 bot、Ctrl-C、斷線）後重跑會從沒做完的段落繼續。
+# 收完之後 search_emails / search_course_emails 都改在本機查整個信箱。
+BACKFILL_WORKERS = int(os.getenv("GMAIL_BACKFILL_WORKERS", "4"))  # Gmail 每個帳號最多約 15 條同時連線
+CHUNK_SIZE = 500  # 每段的 UID 範圍；範圍固定，中斷前後切出來的段落才會一樣
+
+# 目前（或最後一次）收錄的進度，給 bot 指令顯示
+progress = {"running": False, "chunks": 0, "total_chunks": 0, "messages": 0, "failed": 0,
+            "courses": Counter(), "started": None, "finished": None}
+
+def plan(mail, cache, chunk_size=CHUNK_SIZE):
+    """回傳 (UIDVALIDITY, {段落編號: [UID]})，只包含還沒收錄的段落"""
+    uidvalidity, synced = gmail_api._sync(mail, cache)
+    low = cache.get_mark("archive_low")
+    if low is None:  # 有索引之前建立的快取，從同步基準往回收
+        low = synced + 1
+    if low <= 1:
+        return uidvalidity, {}
+    done = cache.backfilled_chunks(uidvalidity)
+    chunks = {}
+    for uid in gmail_api._uid_search(mail, ["UID", f"1:{low - 1}"]):
+        chunk = (uid - 1) // chunk_size
+        if uid < low and chunk not in done:
+            chunks.setdefault(chunk, []).append(uid)
+    return uidvalidity, chunks
+
+def backfill_mailbox(workers=BACKFILL_WORKERS, chunk_size=CHUNK_SIZE, on_progress=None, stop=None):
+    """把整個信箱收進全文索引，回傳這次的結果（dict）；remaining 是 0 代表整個信箱都收完了。
+    on_progress 會在每段完成時（從工作執行緒）被呼叫，參數是 progress 的複本。"""
+    stop = stop or threading.Event()
+    cache = gmail_api.get_cache()
+    uidvalidity, chunks = gmail_api.pool.run(lambda mail: plan(mail, cache, chunk_size))
+    pending = Queue()
+    for chunk in sorted(chunks, reverse=True):  # 從新到舊，最近的課程信件先收進來
+        pending.put((chunk, sorted(chunks[chunk])))
+    lock = threading.Lock()
+    progress.update(running=True, chunks=0, total_chunks=len(chunks), messages=0, failed=0,
+                    courses=Counter(), started=time.time(), finished=None)
+
+    def fetch(mail, uids):
+        """抓一段信件，失敗時換一條新連線重試一次；回傳 (連線, 信件資料或 None)。
+        要到的 UID 都拿到了（或沒拿到的已經從伺服器上刪掉）才算成功，否則這段留給下次"""
+        for _ in range(2):
+            try:
+                if mail is None:
+                    mail = gmail_api.connect_to_gmail()
+                records = gmail_api.fetch_messages(mail, uids)
+                missing = set(uids) - {record["UID"] for record in records}
+                if missing and gmail_api._uid_search(mail, ["UID", gmail_api.uid_set(missing)]) & missing:
+                    raise imaplib.IMAP4.error(f"有 {len(missing)} 封信沒拿到")
+                return mail, records
+            except (imaplib.IMAP4.error, OSError) as e:
+                print(f"⚠️ 收錄 UID {uids[0]}–{uids[-1]} 失敗：{e}")
+                if mail is not None:
+                    gmail_api.pool._discard(mail)
+                    mail = None
+        return mail, None
+
+    def work():
+        mail = None  # 每個工作執行緒用自己的連線，不佔用連線池（互動查詢照常進行）
+        try:
+            while not stop.is_set():
+                try:
+                    chunk, uids = pending.get_nowait()
+                except Empty:
+                    return
+                mail, records = fetch(mail, uids)
+                ok = records is not None and cache.archive_chunk(uidvalidity, chunk, records)
+                courses = Counter(course for course in (gmail_api.course_of(r["From"]) for r in records or []) if course)
+                with lock:
+                    if ok:
+                        progress["chunks"] += 1
+                        progress["messages"] += len(records)
+                        progress["courses"].update(courses)
+                    else:
+                        progress["failed"] += 1
+                    snapshot = dict(progress, courses=Counter(progress["courses"]))
+                if on_progress:
+                    on_progress(snapshot)
+        finally:
+            if mail is not None:
+                gmail_api.pool._discard(mail)
+
+    workers = max(1, min(workers, len(chunks)))
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gmail-backfill") as executor:
+            futures = [executor.submit(work) for _ in range(workers)]
+            try:
+                for future in futures:
+                    future.result()
+            except BaseException:  # Ctrl-C 或被取消：做到一半的段落做完就停
+                stop.set()
+                raise
+    finally:
+        progress.update(running=False, finished=time.time())
+
+    remaining = progress["total_chunks"] - progress["chunks"]
+    if remaining == 0:
+        cache.set_mark("archive_low", uidvalidity, 0)
+    return {"messages": progress["messages"], "chunks": progress["chunks"], "remaining": remaining,
+            "failed": progress["failed"], "seconds": progress["finished"] - progress["started"],
+            "courses": Counter(progress["courses"])}
+
+# 命令列：python mail_backfill.py --workers 8
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="把整個 Gmail 信箱收進本機全文索引（可中斷，重跑會從中斷處繼續）")
+    parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS, help="同時使用幾條 IMAP 連線")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="每段的 UID 範圍（中途不要更改）")
+    args = parser.parse_args()
+
+    def show(state):
+        rate = state["messages"] / max(time.time() - state["started"], 1e-9)
+        print(f"\r📚 {state['chunks']}/{state['total_chunks']} 段，{state['messages']} 封（每秒 {rate:.0f} 封）", end="", flush=True)
+
+    try:
+        result = backfill_mailbox(args.workers, args.chunk_size, on_progress=show)
+    except KeyboardInterrupt:
+        print(f"\n⏸️ 已中斷，完成 {progress['chunks']}/{progress['total_chunks']} 段，下次執行會從沒做完的段落繼續")
+    else:
+        print(f"\n✅ 收錄 {result['messages']} 封信，花了 {result['seconds']:.1f} 秒")
+        for course, count in result["courses"].most_common():
+            print(f"   📚 {course}：{count} 封")
+        if result["remaining"]:
+            print(f"⚠️ 還有 {result['remaining']} 段失敗，重新執行會再試一次")
+        else:
+            print("✅ 整個信箱都已收進全文索引")
+    gmail_api.pool.close_all()
@@ -0,0 +1,161 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+# 本機信件標頭快取：以 (UIDVALIDITY, UID) 當 key，記錄每個使用者（consumer）看到哪一封
+# 另外有一個 FTS5 全文索引（archive）收錄標頭和內文，關鍵字、寄件人、日期區間的查詢都在本機完成
+MAIL_CACHE_PATH = os.getenv("MAIL_CACHE_PATH", "mail_cache.db")
+
+class MailCache:
+    def __init__(self, path=MAIL_CACHE_PATH):
+        self._conn = sqlite3.connect(path, check_same_thread=False)  # 會在 Gmail 執行緒池中使用
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    uidvalidity INTEGER NOT NULL,
+                    uid INTEGER NOT NULL,
+                    message_id TEXT,
+                    sender TEXT,
+                    subject TEXT,
+                    date TEXT,
+                    PRIMARY KEY (uidvalidity, uid)
+                );
+                CREATE TABLE IF NOT EXISTS marks (
+                    name TEXT PRIMARY KEY,
+                    uidvalidity INTEGER NOT NULL,
+                    uid INTEGER NOT NULL
+                );
+                -- rowid 就是 UID；trigram 分詞讓中文也能做子字串查詢
+                CREATE VIRTUAL TABLE IF NOT EXISTS archive USING fts5(
+                    sender, subject, body,
+                    date UNINDEXED, ts UNINDEXED, message_id UNINDEXED,
+                    tokenize = 'trigram'
+                );
+                -- 批次收錄（mail_backfill）已經完成的 UID 段落，中斷後重跑會跳過
+                CREATE TABLE IF NOT EXISTS backfill_chunks (
+                    uidvalidity INTEGER NOT NULL,
+                    chunk INTEGER NOT NULL,
+                    messages INTEGER NOT NULL,
+                    PRIMARY KEY (uidvalidity, chunk)
+                );
+            """)
+
+    def uidvalidity(self):
+        """目前快取對應的 UIDVALIDITY，沒有資料時回傳 None"""
+        with self._lock:
+            row = self._conn.execute("SELECT uidvalidity FROM marks WHERE name = 'sync'").fetchone()
+        return row[0] if row else None
+
+    def reset(self, uidvalidity):
+        """UIDVALIDITY 變了代表舊的 UID 都失效，清掉重來"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages WHERE uidvalidity != ?", (uidvalidity,))
+            self._conn.execute("DELETE FROM marks")
+            self._conn.execute("DELETE FROM archive")
+            self._conn.execute("DELETE FROM backfill_chunks")
+
+    def get_mark(self, name):
+        """取得 name 的高水位（已處理到的最大 UID），沒有時回傳 None"""
+        with self._lock:
+            row = self._conn.execute("SELECT uid FROM marks WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_mark(self, name, uidvalidity, uid):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO marks (name, uidvalidity, uid) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET uidvalidity = excluded.uidvalidity, uid = excluded.uid",
+                (name, uidvalidity, uid)
+            )
+
+    def store(self, uidvalidity, records):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO messages (uidvalidity, uid, message_id, sender, subject, date) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(uidvalidity, r["UID"], r["Message-ID"], r["From"], r["Subject"], r["Date"]) for r in records]
+            )
+
+    def headers_after(self, uidvalidity, uid, until=None):
+        """回傳 UID 大於 uid（且不超過 until）的信件資料（由舊到新）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT uid, sender, subject, date, message_id FROM messages "
+                "WHERE uidvalidity = ? AND uid > ? AND uid <= ? ORDER BY uid",
+                (uidvalidity, uid, until if until is not None else 2 ** 63 - 1)
+            ).fetchall()
+        return [{"UID": row[0], "From": row[1], "Subject": row[2], "Date": row[3], "Message-ID": row[4]} for row in rows]
+
+    def archive(self, records):
+        """把信件（含 Body 內文、ts 時間戳）收進全文索引，已經有的 UID 會覆蓋"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO archive (rowid, sender, subject, body, date, ts, message_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(r["UID"], r["From"], r["Subject"], r.get("Body", ""), r["Date"], r.get("ts"), r["Message-ID"]) for r in records]
+            )
+
+    def backfilled_chunks(self, uidvalidity):
+        with self._lock:
+            rows = self._conn.execute("SELECT chunk FROM backfill_chunks WHERE uidvalidity = ?", (uidvalidity,)).fetchall()
+        return {row[0] for row in rows}
+
+    def archive_chunk(self, uidvalidity, chunk, records):
+        """把一整段信件收進全文索引並記下這段已完成（同一個 transaction，中斷時不會只做一半）。
+        收錄途中 UIDVALIDITY 變了的話什麼都不做，回傳 False"""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT uidvalidity FROM marks WHERE name = 'sync'").fetchone()
+            if not row or row[0] != uidvalidity:
+                return False
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO archive (rowid, sender, subject, body, date, ts, message_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(r["UID"], r["From"], r["Subject"], r.get("Body", ""), r["Date"], r.get("ts"), r["Message-ID"]) for r in records]
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO backfill_chunks (uidvalidity, chunk, messages) VALUES (?, ?, ?)",
+                (uidvalidity, chunk, len(records))
+            )
+        return True
+
+    def archive_complete(self):
+        """archive_low 是 0 代表整個信箱都收進索引了"""
+        return self.get_mark("archive_low") == 0
+
+    def search(self, keyword=None, senders=None, since=None, before=None, limit=30):
+        """在全文索引中查詢，回傳最多 limit 封信件（有關鍵字時依相關度排序，否則從最新到舊）。
+        keyword 比對寄件人、主旨和內文；senders 任一符合即可；since / before 是 date。"""
+        where, params = [], []
+        if senders:
+            where.append("(" + " OR ".join("instr(lower(sender), lower(?)) > 0" for _ in senders) + ")")
+            params += list(senders)
+        if since:
+            where.append("ts >= ?")
+            params.append(datetime.combine(since, datetime.min.time()).timestamp())
+        if before:
+            where.append("ts < ?")
+            params.append(datetime.combine(before, datetime.min.time()).timestamp())
+
+        order = "rowid DESC"
+        order_params = []
+        if keyword and len(keyword) >= 3:
+            where.append("archive MATCH ?")
+            params.append('"' + keyword.replace('"', '""') + '"')  # 整串當成一個片語
+            order = "bm25(archive, 5.0, 10.0, 1.0), rowid DESC"  # 主旨 > 寄件人 > 內文
+        elif keyword:
+            # trigram 至少要 3 個字，太短的關鍵字（例如兩個中文字）改用 LIKE 掃描
+            like = "%" + keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            where.append("(sender LIKE ? ESCAPE '\\' OR subject LIKE ? ESCAPE '\\' OR body LIKE ? ESCAPE '\\')")
+            params += [like, like, like]
+            order = "CASE WHEN subject LIKE ? ESCAPE '\\' THEN 0 WHEN sender LIKE ? ESCAPE '\\' THEN 1 ELSE 2 END, rowid DESC"
+            order_params = [like, like]
+
+        sql = "SELECT rowid, sender, subject, date, message_id FROM archive"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {order} LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(sql, params + order_params + [limit]).fetchall()
+        return [{"UID": row[0], "From": row[1], "Subject": row[2], "Date": row[3], "Message-ID": row[4]} for row in rows]
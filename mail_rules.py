@@ -0,0 +1,69 @@
+import json
+import os
+import re
+from dataclasses import dataclass
+
+# 信件分類規則放在 json 裡，新增助教或分類只要改設定檔
+MAIL_RULES_PATH = os.getenv("MAIL_RULES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "mail_rules.json"))
+
+@dataclass
+class MailRule:
+    tag: str
+    section: str  # 通知訊息中的段落標題，多個規則可以共用同一段
+    fields: list
+    patterns: dict  # 關鍵字 -> 標籤值（例如助教名字 -> 課程），清單形式的設定標籤值就是 tag
+    label: str = None  # 顯示標籤值時的名稱，例如「課程」
+
+class MailClassifier:
+    """把所有規則的關鍵字編譯成每個欄位一個 regex，一次掃描就替信件標上所有符合的規則"""
+
+    def __init__(self, rules):
+        self.rules = rules
+        self._matchers = {}
+        for field in {field for rule in rules for field in rule.fields}:
+            # 關鍵字 -> [(規則順序, 關鍵字順序, 規則)]，順序小的優先（和原本逐一比對 dict 的結果相同）
+            targets = {}
+            for rule_index, rule in enumerate(rules):
+                if field not in rule.fields:
+                    continue
+                for pattern_index, pattern in enumerate(rule.patterns):
+                    targets.setdefault(pattern, []).append((rule_index, pattern_index, rule))
+            # 長的關鍵字排前面；用 lookahead 讓每個位置都能比對，重疊的關鍵字也不會漏掉
+            alternation = "|".join(re.escape(p) for p in sorted(targets, key=len, reverse=True))
+            regex = re.compile(f"(?=({alternation}))")
+            # 比對到長關鍵字時，被它包含的短關鍵字也一定出現了
+            implied = {p: [q for q in targets if q in p] for p in targets}
+            self._matchers[field] = (regex, targets, implied)
+
+    def classify(self, record):
+        """回傳 {tag: 標籤值}，沒有符合任何規則時回傳空 dict"""
+        best = {}
+        for field, (regex, targets, implied) in self._matchers.items():
+            text = record.get(field) or ""
+            for match in regex.finditer(text):
+                for pattern in implied[match.group(1)]:
+                    for rule_index, pattern_index, rule in targets[pattern]:
+                        key = (rule_index, pattern_index)
+                        if rule.tag not in best or key < best[rule.tag][0]:
+                            best[rule.tag] = (key, rule.patterns[pattern])
+        return {tag: value for tag, (_, value) in sorted(best.items(), key=lambda item: item[1][0])}
+
+    def rule(self, tag):
+        for rule in self.rules:
+            if rule.tag == tag:
+                return rule
+        return None
+
+def load_rules(path=MAIL_RULES_PATH):
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    rules = []
+    for item in config:
+        patterns = item["patterns"]
+        if isinstance(patterns, list):
+            patterns = {pattern: item["tag"] for pattern in patterns}
+        rules.append(MailRule(item["tag"], item.get("section", item["tag"]), item.get("fields", ["From", "Subject"]), patterns, item.get("label")))
+    return rules
+
+def load_classifier(path=MAIL_RULES_PATH):
+    return MailClassifier(load_rules(path))
@@ -0,0 +1,129 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# 簡易的 Prometheus 指標：Histogram、Counter 和 Gauge，輸出成 Prometheus 文字格式給 /metrics 使用
+# IMAP 在執行緒池裡跑，所以每個指標都有自己的鎖
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+_registry = []
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _label_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labels, key)} {_number(value)}")
+        return lines
+
+class Gauge:
+    """目前的數值（例如佇列長度），可以增減"""
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def set(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labels, key)} {_number(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._values = {}  # labels -> [各 bucket 次數, 總和, 次數]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        """with 區塊花了多久（秒），發生例外也會記錄"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{_label_text(self.labels, key, [('le', _number(bound))])} {cumulative}")
+                lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {_number(total)}")
+                lines.append(f"{self.name}_count{_label_text(self.labels, key)} {count}")
+        return lines
+
+def render():
+    """所有指標的 Prometheus 文字格式"""
+    return "\n".join(line for metric in _registry for line in metric.render()) + "\n"
+
+# bot 的熱路徑
+IMAP_SECONDS = Histogram("littleybj_imap_seconds", "IMAP 指令耗時", ["op"])
+NOTION_SECONDS = Histogram("littleybj_notion_request_seconds", "Notion API 請求耗時（不含排隊）", ["method", "status"])
+NOTION_QUEUE_DEPTH = Gauge("littleybj_notion_queue_depth", "在速率限制前排隊等待的 Notion 請求數")
+NOTION_WAIT_SECONDS = Histogram("littleybj_notion_wait_seconds", "Notion 請求在速率限制前排隊的時間", ["priority"],
+                                buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60))
+NOTION_RESPONSES = Counter("littleybj_notion_responses_total", "Notion API 回應狀態碼", ["status"])
+DISCORD_SEND_SECONDS = Histogram("littleybj_discord_send_seconds", "Discord 傳送訊息耗時")
+TIMER_SKEW_SECONDS = Histogram("littleybj_timer_skew_seconds", "鬧鐘實際觸發時間和預定時間的差距",
+                               buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 30, 60, 300, 1800))
+MAIL_SCANNED = Histogram("littleybj_mail_scanned_messages", "每次 check_email 處理的信件數", ["mode"], buckets=COUNT_BUCKETS)
+LOOP_LAG_SECONDS = Histogram("littleybj_event_loop_lag_seconds", "event loop 排程延遲（heartbeat 比預定晚醒來多久）",
+                             buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 5, 10))
@@ -0,0 +1,236 @@
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import time
+from contextlib import aclosing
+import aiohttp
+from dotenv import load_dotenv
+from metrics import NOTION_SECONDS, NOTION_RESPONSES, NOTION_QUEUE_DEPTH, NOTION_WAIT_SECONDS
+
+# 載入 .env 中的 Notion 設定
+load_dotenv()
+NOTION_API_KEY = os.getenv("NOTION_API_KEY")
+NOTION_DATABASE_ID = os.getenv("NOTION_DATABASE_ID")
+NOTION_API_URL = os.getenv("NOTION_API_URL", "https://api.notion.com/v1")  # benchmark 會指向本機的假 API
+NOTION_VERSION = "2022-06-28"
+
+# 請求優先順序：使用者操作（modal 送出等）先於背景同步
+INTERACTIVE = 0
+BACKGROUND = 1
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class NotionError(Exception):
+    def __init__(self, status, detail):
+        super().__init__(f"Notion 請求失敗，錯誤碼：{status}，錯誤訊息：{detail}")
+        self.status = status
+        self.detail = detail
+
+class RateLimiter:
+    """Token bucket 排程器：平均每秒放行 rate 個請求，最多累積 burst 個。
+    排隊中的請求依優先順序（同優先順序先到先出）放行；收到 429 時整個 bucket 暫停到 Retry-After 之後。"""
+
+    def __init__(self, rate=3, burst=3):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0
+        self._waiters = []  # heap: (優先順序, 序號, future, 排隊時間)
+        self._seq = itertools.count()
+        self._pump_task = None
+        # 統計
+        self.requests = 0
+        self.throttled = 0  # 收到 429 的次數
+        self.retries = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def acquire(self, priority=INTERACTIVE):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future, time.monotonic()))
+        NOTION_QUEUE_DEPTH.set(len(self._waiters))
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = loop.create_task(self._pump())
+        await future  # 被取消時 future 也會變成 cancelled，_pump 會跳過它
+
+    async def _pump(self):
+        while self._waiters:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            delay = max(self._paused_until - now, (1 - self._tokens) / self.rate if self._tokens < 1 else 0)
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            priority, _, future, enqueued = heapq.heappop(self._waiters)
+            NOTION_QUEUE_DEPTH.set(len(self._waiters))
+            if future.done():
+                continue
+            self._tokens -= 1
+            waited = now - enqueued
+            self.requests += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            NOTION_WAIT_SECONDS.observe(waited, priority="interactive" if priority == INTERACTIVE else "background")
+            if waited > 2:
+                print(f"⏳ Notion 請求排隊 {waited:.1f} 秒（佇列中還有 {len(self._waiters)} 個）")
+            future.set_result(None)
+
+    def pause(self, seconds):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def stats(self):
+        return {
+            "queue_depth": len(self._waiters),
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "avg_wait": self.total_wait / self.requests if self.requests else 0.0,
+            "max_wait": self.max_wait
+        }
+
+class NotionClient:
+    """共用的 Notion 連線：整個 bot 只用一個 aiohttp session，保持 keep-alive，每個請求都重用已經握手好的 TLS 連線"""
+
+    def __init__(self, api_key=NOTION_API_KEY, database_id=NOTION_DATABASE_ID, limit=10, timeout=30, max_retries=4):
+        self.database_id = database_id
+        self.headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+            "Notion-Version": NOTION_VERSION
+        }
+        self.limit = limit  # 同時最多幾條連線
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.limiter = RateLimiter()  # Notion 限制大約每秒 3 個請求
+        self._session = None
+        self._loop = None
+        self.last_success = None  # 最後一次成功 / 失敗的時間（time.time()），給健康檢查用
+        self.last_error = None
+
+    def _get_session(self):
+        loop = asyncio.get_running_loop()
+        # session 綁定建立它的 event loop，換了 loop 就要重建
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.limit, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                headers=self.headers,
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self._loop = loop
+        return self._session
+
+    async def _send(self, method, path, json):
+        start = time.perf_counter()
+        status, data, retry_after = await self._send_once(method, path, json)
+        NOTION_SECONDS.observe(time.perf_counter() - start, method=method, status=status)
+        NOTION_RESPONSES.inc(status=status)  # 0 代表連線失敗
+        if status == 200:
+            self.last_success = time.time()
+        elif status == 0 or status in RETRY_STATUSES:
+            self.last_error = time.time()
+        return status, data, retry_after
+
+    async def _send_once(self, method, path, json):
+        session = self._get_session()
+        try:
+            async with session.request(method, f"{NOTION_API_URL}{path}", json=json) as response:
+                if response.status == 200:
+                    return response.status, await response.json(), None
+                return response.status, await response.text(), response.headers.get("Retry-After")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return 0, f"連線失敗：{e!r}", None
+
+    async def request(self, method, path, json=None, priority=INTERACTIVE):
+        """經過速率限制排程後送出請求，429 / 5xx 會自動重試。
+        回傳 (狀態碼, 回應內容)；成功時回應內容是 dict，失敗時是錯誤訊息字串"""
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire(priority)
+            status, data, retry_after = await self._send(method, path, json)
+            if status not in RETRY_STATUSES or attempt == self.max_retries:
+                return status, data
+
+            # 有 Retry-After 就照它等，否則指數退避；再加上隨機抖動，避免大家同時重試
+            try:
+                delay = float(retry_after)
+            except (TypeError, ValueError):
+                delay = 0.5 * 2 ** attempt
+            delay += random.uniform(0, delay / 2)
+            if status == 429:
+                self.limiter.throttled += 1
+                self.limiter.pause(delay)
+            self.limiter.retries += 1
+            print(f"⚠️ Notion 回應 {status}，{delay:.1f} 秒後重試（第 {attempt + 1} 次）")
+            await asyncio.sleep(delay)
+
+    async def query(self, filter=None, sorts=None, start_cursor=None, page_size=100, priority=INTERACTIVE):
+        data = {"page_size": page_size}
+        if filter:
+            data["filter"] = filter
+        if sorts:
+            data["sorts"] = sorts
+        if start_cursor:
+            data["start_cursor"] = start_cursor
+        return await self.request("POST", f"/databases/{self.database_id}/query", data, priority)
+
+    async def iter_query(self, filter=None, sorts=None, page_size=100, priority=INTERACTIVE):
+        """逐頁串流查詢結果（async generator）。處理這一頁時已經在背景預抓下一頁；
+        呼叫端提早結束時（用 contextlib.aclosing 包起來），預抓中的請求會被取消，不會把整個資料庫讀進記憶體。"""
+        next_page = asyncio.ensure_future(self.query(filter, sorts, None, page_size, priority))
+        try:
+            while next_page is not None:
+                status, data = await next_page
+                next_page = None
+                if status != 200:
+                    raise NotionError(status, data)
+                if data.get("has_more"):
+                    next_page = asyncio.ensure_future(self.query(filter, sorts, data["next_cursor"], page_size, priority))
+                for page in data["results"]:
+                    yield page
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+
+    async def first(self, filter=None, sorts=None):
+        """回傳第一筆符合的頁面，沒有時回傳 None"""
+        # aclosing 讓 generator 馬上結束並取消預抓，而不是等到被回收
+        async with aclosing(self.iter_query(filter, sorts, page_size=1)) as pages:
+            async for page in pages:
+                return page
+        return None
+
+    async def create(self, properties):
+        data = {
+            "parent": {"database_id": self.database_id},
+            "properties": properties
+        }
+        return await self.request("POST", "/pages", data)
+
+    async def update(self, page_id, properties):
+        return await self.request("PATCH", f"/pages/{page_id}", {"properties": properties})
+
+    async def archive(self, page_id):
+        return await self.request("PATCH", f"/pages/{page_id}", {"archived": True})
+
+    async def archive_many(self, page_ids, concurrency=5, priority=INTERACTIVE):
+        """同時封存多個頁面（最多 concurrency 個同時進行），回傳和 page_ids 同順序的 (狀態碼, 回應內容)"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def archive_one(page_id):
+            async with semaphore:
+                return await self.request("PATCH", f"/pages/{page_id}", {"archived": True}, priority)
+
+        return await asyncio.gather(*(archive_one(page_id) for page_id in page_ids))
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+notion = NotionClient()
@@ -0,0 +1,154 @@
+import asyncio
+import time
+from notion_api import notion, BACKGROUND
+
+# Notion 頁面屬性的讀取小工具
+def page_title(page, name="Name"):
+    title = page["properties"][name]["title"]
+    return title[0]["text"]["content"] if title else ""
+
+def page_text(page, name):
+    prop = page["properties"].get(name)  # 舊的資料庫可能還沒有這個欄位
+    rich_text = prop["rich_text"] if prop else None
+    return rich_text[0]["text"]["content"] if rich_text else ""
+
+def page_number(page, name):
+    return page["properties"][name]["number"]
+
+def page_select(page, name):
+    prop = page["properties"].get(name)
+    select = prop["select"] if prop else None
+    return select["name"] if select else None
+
+class NotionMirror:
+    """Notion 資料庫的本機鏡像：啟動時整個載入，依 Name 和 category 建索引，查詢都是 dict 查表。
+    bot 自己的寫入會同步更新鏡像（write-through）；直接在 Notion 上的修改靠 last_edited_time 輪詢補上，
+    刪除則靠每隔 ttl 秒的完整重新載入。"""
+
+    def __init__(self, client, ttl=15 * 60, poll_interval=60, page_size=100):
+        self.client = client
+        self.page_size = page_size
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.pages = {}  # page_id -> page
+        self.by_name = {}  # Name -> page
+        self.by_category = {}  # category -> {page_id: page}
+        self.loaded_at = None
+        self._last_edited = None  # 目前看過最新的 last_edited_time
+        self._lock = asyncio.Lock()
+        self.listeners = []  # 每次背景同步完成後呼叫的 async 函式，用來同步其他記憶體狀態
+
+    async def load(self):
+        """完整重新載入整個資料庫（分頁查詢）"""
+        pages = [page async for page in self.client.iter_query(page_size=self.page_size, priority=BACKGROUND)]
+        self.pages.clear()
+        self.by_name.clear()
+        self.by_category.clear()
+        self._last_edited = None
+        for page in pages:
+            self.upsert(page)
+        self.loaded_at = time.monotonic()
+
+    async def ensure_loaded(self):
+        async with self._lock:
+            if self.loaded_at is None:
+                await self.load()
+
+    async def poll(self):
+        """只抓上次之後在 Notion 上被修改過的頁面"""
+        if self._last_edited is None:
+            return await self.load()
+        query_filter = {
+            "timestamp": "last_edited_time",
+            "last_edited_time": {"on_or_after": self._last_edited}
+        }
+        async for page in self.client.iter_query(query_filter, page_size=self.page_size, priority=BACKGROUND):
+            self.upsert(page)
+
+    async def run_refresh_loop(self):
+        """背景同步：定期輪詢修改，超過 ttl 就完整重新載入"""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                async with self._lock:
+                    if self.loaded_at is None or time.monotonic() - self.loaded_at > self.ttl:
+                        await self.load()
+                    else:
+                        await self.poll()
+                for listener in self.listeners:
+                    await listener()
+            except Exception as e:
+                print(f"❌ Notion 鏡像同步失敗：{e}")
+
+    def upsert(self, page):
+        if page.get("archived") or page.get("in_trash"):
+            return self.remove(page["id"])
+        self.remove(page["id"])
+        self.pages[page["id"]] = page
+        self.by_name[page_title(page)] = page
+        self.by_category.setdefault(page_select(page, "category"), {})[page["id"]] = page
+        edited = page.get("last_edited_time")
+        if edited and (self._last_edited is None or edited > self._last_edited):
+            self._last_edited = edited
+
+    def remove(self, page_id):
+        page = self.pages.pop(page_id, None)
+        if page is None:
+            return
+        name = page_title(page)
+        if self.by_name.get(name) is page:
+            del self.by_name[name]
+            # 有同名的其他頁面時，讓索引指向它
+            for other in self.pages.values():
+                if page_title(other) == name:
+                    self.by_name[name] = other
+                    break
+        self.by_category.get(page_select(page, "category"), {}).pop(page_id, None)
+
+    async def get(self, name):
+        await self.ensure_loaded()
+        page = self.by_name.get(name)
+        if page is None:
+            # 可能是剛在 Notion 上新增、還沒輪詢到的頁面，直接查第一筆符合的
+            page = await self.client.first({"property": "Name", "title": {"equals": name}})
+            if page is not None:
+                self.upsert(page)
+        return page
+
+    async def category(self, category):
+        """某個 category 的所有頁面（依建立時間排序）"""
+        await self.ensure_loaded()
+        return sorted(self.by_category.get(category, {}).values(), key=lambda page: page.get("created_time", ""))
+
+    # 寫入：先寫 Notion，成功後用回應的頁面更新鏡像
+    async def create(self, properties):
+        status, data = await self.client.create(properties)
+        if status == 200:
+            self.upsert(data)
+        return status, data
+
+    async def update(self, page_id, properties):
+        status, data = await self.client.update(page_id, properties)
+        if status == 200:
+            self.upsert(data)
+        return status, data
+
+    async def archive(self, page_id):
+        status, data = await self.client.archive(page_id)
+        if status == 200:
+            self.remove(page_id)
+        return status, data
+
+    async def archive_pages(self, items):
+        """同時封存多個已知 ID 的頁面，items 是 [(名稱, 頁面 ID)]，回傳 [(名稱, 是否成功, 說明)]"""
+        responses = await self.client.archive_many([page_id for _, page_id in items])
+        results = []
+        for (name, page_id), (status, data) in zip(items, responses):
+            if status == 200:
+                self.remove(page_id)
+                results.append((name, True, "已刪除"))
+            else:
+                results.append((name, False, f"錯誤碼：{status}，錯誤訊息：{data}"))
+        return results
+
+notion_db = NotionMirror(notion)
@@ -0,0 +1,114 @@
+import asyncio
+import datetime
+import heapq
+import itertools
+from zoneinfo import ZoneInfo
+
+TAIPEI = ZoneInfo("Asia/Taipei")  # 使用台北時間，避免Render所在時區不同
+MAX_SLEEP = 60 * 60  # 最久睡一小時就醒來重新對時，避免主機休眠等造成的誤差
+
+# after 之後（不含 after）下一次到 hour:minute 的時間；repeat 為 weekdays 的鬧鐘跳過週末
+def next_fire(timer, after):
+    candidate = after.replace(hour=timer.hour, minute=timer.minute, second=0, microsecond=0)
+    if candidate <= after:
+        candidate += datetime.timedelta(days=1)
+    if getattr(timer, "repeat", "daily") == "weekdays":
+        while candidate.weekday() >= 5:
+            candidate += datetime.timedelta(days=1)
+    return candidate
+
+class TimerScheduler:
+    """用 min-heap 排每個鬧鐘的下一次觸發時間，只睡到最近的 deadline 才醒來。
+    新增、修改、刪除鬧鐘都是 O(log n)（舊的 heap 項目留著，輪到時再丟掉）。"""
+
+    def __init__(self, on_fire, catch_up=datetime.timedelta(minutes=30), on_expire=None):
+        self.on_fire = on_fire  # async on_fire([(key, timer, 預定時間)])，同一時間到期的一起送
+        self.on_expire = on_expire  # async on_expire([(key, timer, 預定時間)])：延遲太久被略過、不會再排程的單次鬧鐘
+        self.catch_up = catch_up  # 卡住之後，延遲多久以內的鬧鐘還要補發
+        self._heap = []  # (觸發時間, 序號, key)
+        self._entries = {}  # key -> (觸發時間, 序號, timer, 排程時的設定)
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+
+    def schedule(self, key, timer, now=None):
+        """新增或更新鬧鐘；時間沒變就保留原本排好的觸發時間"""
+        # 記下排程當時的設定，timer 物件被直接修改時也比對得出來
+        setting = (timer.hour, timer.minute, getattr(timer, "repeat", "daily"))
+        entry = self._entries.get(key)
+        if entry and entry[3] == setting:
+            self._entries[key] = (entry[0], entry[1], timer, setting)
+            return
+        fire_at = next_fire(timer, now or datetime.datetime.now(TAIPEI))
+        seq = next(self._seq)
+        self._entries[key] = (fire_at, seq, timer, setting)
+        heapq.heappush(self._heap, (fire_at, seq, key))
+        self._wakeup.set()
+
+    def remove(self, key):
+        if self._entries.pop(key, None):
+            self._wakeup.set()
+
+    def keys(self):
+        return self._entries.keys()
+
+    def next_deadline(self):
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def _drop_stale(self):
+        while self._heap:
+            fire_at, seq, key = self._heap[0]
+            entry = self._entries.get(key)
+            if entry and entry[1] == seq:
+                return
+            heapq.heappop(self._heap)
+
+    def _pop_due(self, now):
+        """回傳 (要觸發的鬧鐘, 延遲太久而作廢的單次鬧鐘)"""
+        due, expired = [], []
+        while True:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return due, expired
+            fire_at, seq, key = heapq.heappop(self._heap)
+            timer = self._entries[key][2]
+            once = getattr(timer, "repeat", "daily") == "once"
+            if now - fire_at <= self.catch_up:
+                due.append((key, timer, fire_at))
+            else:
+                print(f"⚠️ 鬧鐘 {key} 延遲太久（預定 {fire_at:%H:%M}），略過這次")
+                if once:
+                    expired.append((key, timer, fire_at))
+            if once:
+                del self._entries[key]  # 只響一次的鬧鐘不再排程
+                continue
+            # 從現在往後排下一次，卡住很久也只補發一次
+            next_at = next_fire(timer, max(fire_at, now))
+            next_seq = next(self._seq)
+            self._entries[key] = (next_at, next_seq, timer, self._entries[key][3])
+            heapq.heappush(self._heap, (next_at, next_seq, key))
+
+    async def run(self):
+        while True:
+            now = datetime.datetime.now(TAIPEI)
+            due, expired = self._pop_due(now)
+            if expired and self.on_expire:
+                # 不通知的話呼叫端還留著這個鬧鐘，下次對帳又會重新排程，隔天才響
+                try:
+                    await self.on_expire(expired)
+                except Exception as e:
+                    print(f"❌ 作廢鬧鐘處理失敗：{e}")
+            if due:
+                try:
+                    await self.on_fire(due)
+                except Exception as e:
+                    print(f"❌ 鬧鐘處理失敗：{e}")
+                continue
+
+            deadline = self.next_deadline()
+            timeout = MAX_SLEEP if deadline is None else min((deadline - now).total_seconds(), MAX_SLEEP)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass